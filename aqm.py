@@ -0,0 +1,193 @@
+# aqm.py
+'''
+Drop policies (active queue management) for interfaces.
+
+A policy set on an Interface (Interface.set_drop_policy, or Router's
+drop_policy for all its outgoing interfaces) is asked whether to admit each
+packet put on the interface and whether to keep each packet taken off it:
+
+    TailDrop  drops arriving packets while the queue holds a number of packets
+              or bytes
+    Red       random early detection: drops arriving packets with a probability
+              growing with the average queue length
+    CoDel     controlled delay: drops departing packets while the time they
+              spent queued (their sojourn time) stays above a target
+
+Packets refused on arrival make Interface.put raise PolicyDrop, a queue.Full
+for callers that do not tell them apart from a full queue, once the interface
+has traced and counted the drop; packets dropped on departure are never
+returned by get. Every policy counts its drops. Router(drop_policy=...) takes
+a factory built by make(), e.g. make('codel', target=0.005), as each interface
+needs a policy of its own.
+'''
+
+import math
+import queue
+import random
+import time
+
+
+# Raised by Interface.put when the drop policy refuses a packet. The interface
+# has already traced and counted the drop (drop_aqm), so callers catching it
+# do not count it again.
+class PolicyDrop(queue.Full):
+    pass
+
+
+# Base of the drop policies: admits and keeps every packet.
+class DropPolicy:
+    uses_sojourn = False  # True if keep needs the sojourn times of packets
+
+    def __init__(self):
+        self.drops = 0  # packets dropped
+
+    # called when printing the object
+    def __str__(self):
+        return type(self).__name__
+
+    # decide whether to enqueue a packet
+    # @param qsize: number of packets queued
+    # @param qbytes: bytes queued
+    # @param pkt_S: arriving packet
+    # @return False to drop the packet
+    def admit(self, qsize, qbytes, pkt_S):
+        return True
+
+    # decide whether to hand a dequeued packet on
+    # @param sojourn: seconds the packet spent queued, None if the policy does not use sojourn times
+    # @param qsize: number of packets still queued
+    # @param qbytes: bytes still queued
+    # @return False to drop the packet
+    def keep(self, sojourn, qsize, qbytes):
+        return True
+
+
+# Drops arriving packets while the queue is at a length limit.
+class TailDrop(DropPolicy):
+
+    # @param limit_pkts: maximum number of packets queued, None for no limit
+    # @param limit_bytes: maximum number of bytes queued, None for no limit
+    def __init__(self, limit_pkts=None, limit_bytes=None):
+        DropPolicy.__init__(self)
+        self.limit_pkts = limit_pkts
+        self.limit_bytes = limit_bytes
+
+    def admit(self, qsize, qbytes, pkt_S):
+        if self.limit_pkts is not None and qsize >= self.limit_pkts:
+            return False
+        if self.limit_bytes is not None and qbytes + len(pkt_S) > self.limit_bytes:
+            return False
+        return True
+
+
+# Random early detection (Floyd and Jacobson): the average queue length is an
+# exponentially weighted moving average of the length seen by arriving
+# packets; below min_th nothing is dropped, above max_th everything, and in
+# between packets are dropped with a probability rising linearly to max_p,
+# spread out by the number of packets admitted since the last drop.
+class Red(DropPolicy):
+
+    # @param min_th: average queue length (packets) at which drops start
+    # @param max_th: average queue length (packets) from which every packet is dropped
+    # @param max_p: drop probability reached at max_th
+    # @param weight: weight of the current queue length in the average
+    # @param rng: random.Random, to make runs repeatable
+    def __init__(self, min_th=5, max_th=15, max_p=0.1, weight=0.002, rng=None):
+        DropPolicy.__init__(self)
+        self.min_th = min_th
+        self.max_th = max_th
+        self.max_p = max_p
+        self.weight = weight
+        self.rng = rng if rng is not None else random.Random()
+        self.avg = 0.0  # average queue length
+        self.count = -1  # packets admitted since the last drop, -1 while below min_th
+
+    def admit(self, qsize, qbytes, pkt_S):
+        self.avg += self.weight * (qsize - self.avg)
+        if self.avg < self.min_th:
+            self.count = -1
+            return True
+        if self.avg >= self.max_th:
+            self.count = 0
+            return False
+        self.count += 1
+        p_b = self.max_p * (self.avg - self.min_th) / (self.max_th - self.min_th)
+        p_a = 1.0 if self.count * p_b >= 1 else p_b / (1 - self.count * p_b)
+        if self.rng.random() < p_a:
+            self.count = 0
+            return False
+        return True
+
+
+# Controlled delay (RFC 8289): once the sojourn time of departing packets has
+# stayed above target for a whole interval, packets are dropped at departure,
+# at intervals shrinking with the square root of the number of drops, until
+# the sojourn time falls below target again.
+class CoDel(DropPolicy):
+    uses_sojourn = True
+
+    # @param target: acceptable standing queue delay, in seconds
+    # @param interval: seconds the delay may stay above target before dropping starts
+    # @param mtu: packets are not dropped while no more than this many bytes are queued
+    # @param clock: function returning the current time in seconds
+    def __init__(self, target=0.005, interval=0.1, mtu=1500, clock=time.monotonic):
+        DropPolicy.__init__(self)
+        self.target = target
+        self.interval = interval
+        self.mtu = mtu
+        self.clock = clock
+        self.first_above_time = 0.0  # time at which the delay will have been above target for an interval
+        self.drop_next = 0.0  # time of the next drop while dropping
+        self.count = 0  # drops since dropping started
+        self.last_count = 0  # count when dropping last stopped
+        self.dropping = False
+
+    def control_law(self, t):
+        return t + self.interval / math.sqrt(self.count)
+
+    def keep(self, sojourn, qsize, qbytes):
+        now = self.clock()
+        ok_to_drop = False
+        if sojourn < self.target or qbytes <= self.mtu:
+            self.first_above_time = 0.0
+        elif self.first_above_time == 0.0:
+            self.first_above_time = now + self.interval
+        elif now >= self.first_above_time:
+            ok_to_drop = True
+        if self.dropping:
+            if not ok_to_drop:
+                self.dropping = False
+                return True
+            if now >= self.drop_next:
+                self.count += 1
+                self.drop_next = self.control_law(self.drop_next)
+                return False
+            return True
+        if ok_to_drop:
+            self.dropping = True
+            # start from the previous drop rate if dropping stopped only recently
+            delta = self.count - self.last_count
+            if delta > 1 and now - self.drop_next < 16 * self.interval:
+                self.count = delta
+            else:
+                self.count = 1
+            self.drop_next = self.control_law(now)
+            self.last_count = self.count
+            return False
+        return True
+
+
+policy_D = {'none': DropPolicy, 'tail_drop': TailDrop, 'red': Red, 'codel': CoDel}
+
+
+# a factory of drop policies
+# @param name: 'none', 'tail_drop', 'red' or 'codel'
+# @param params: parameters of the policy, e.g. limit_pkts for tail_drop, target for codel
+# @return function taking no arguments and returning a new policy
+def make(name, **params):
+    if name not in policy_D:
+        raise ValueError('unknown drop policy %r, not one of %s' % (name, ', '.join(policy_D)))
+    policy_class = policy_D[name]
+    return lambda: policy_class(**params)
+
+# EOF
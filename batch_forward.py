@@ -0,0 +1,302 @@
+# batch_forward.py
+'''
+Vectorized batch forwarding with NumPy, for large offline or discrete-event
+runs.
+
+A PacketBatch holds many binary packets in one byte array, with the start and
+length of each packet. A BatchForwarder forwards a whole batch for a router:
+the headers are decoded at once into a structured array (see header_dtype,
+laid out like NetworkPacket.header_struct), the outgoing interfaces are
+looked up with one binary search over the compiled RoutingTable, and the
+packets that do not fit their outgoing interface are fragmented as
+Router.handle_frag would, with the fragment offsets, flags and payloads
+computed by array arithmetic. The result is one PacketBatch per outgoing
+interface, which deliver() puts on the router's interfaces.
+
+    forwarder = BatchForwarder(router)
+    out_D = forwarder.forward(PacketBatch.from_packets(pkt_L), 0)
+    forwarder.deliver(out_D)
+
+Only the binary wire format is supported. Packets are not logged one by one;
+they are traced and counted in metrics like in Router.forward. NumPy is
+optional for the rest of the network, this module needs it.
+'''
+
+import metrics
+import network_3 as network
+import packet_trace
+from rlog import log, DEBUG, ERROR
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+if np is not None:
+    # a binary packet header, see NetworkPacket.header_struct
+    header_dtype = np.dtype({
+        'names': ['id', 'flag', 'tclass', 'offset', 'dst_addr', 'src_addr'],
+        'formats': ['>u4', 'u1', 'u1', '>u4', '>u4', '>u4'],
+        'offsets': [network.NetworkPacket.id_pos, network.NetworkPacket.flag_pos, network.NetworkPacket.tclass_pos,
+                    network.NetworkPacket.offset_pos, network.NetworkPacket.dst_addr_pos,
+                    network.NetworkPacket.src_addr_pos],
+        'itemsize': network.NetworkPacket.header_struct.size})
+else:
+    header_dtype = None
+
+
+# raise unless batches can be forwarded
+def check():
+    if np is None:
+        raise ImportError('batch forwarding needs NumPy')
+    if network.NetworkPacket.wire_format != network.NetworkPacket.BINARY:
+        raise ValueError('batch forwarding needs the binary wire format')
+
+
+# mark spans of an array
+# @param size: length of the array
+# @param lo_A: first index of each span, the spans in order and not overlapping
+# @param hi_A: index after the last of each span
+# @return boolean array of the given length, True inside the spans
+def spans(size, lo_A, hi_A):
+    edge_A = np.empty(2 * len(lo_A) + 1, np.int64)
+    edge_A[0:-1:2] = lo_A
+    edge_A[1:-1:2] = hi_A
+    edge_A[-1] = size
+    # runs of False and True between the edges
+    value_A = np.zeros(len(edge_A), bool)
+    value_A[1::2] = True
+    return np.repeat(value_A, np.diff(edge_A, prepend=0))
+
+
+# the bytes in spans of an array, concatenated
+# @param buf: uint8 array
+# @param lo_A: first index of each span, the spans not overlapping
+# @param hi_A: index after the last of each span
+# @return uint8 array
+def gather(buf, lo_A, hi_A):
+    if (hi_A[:-1] <= lo_A[1:]).all():
+        return buf[spans(len(buf), lo_A, hi_A)]  # spans in order, e.g. a batch made by from_packets
+    # spans out of order, e.g. a batch made by BatchForwarder.forward, whose fragments follow its other packets
+    length_A = hi_A - lo_A
+    return buf[np.repeat(lo_A - (np.cumsum(length_A) - length_A), length_A) + np.arange(int(length_A.sum()))]
+
+
+# Binary packets stored back to back in one byte array.
+class PacketBatch:
+
+    # @param buf: uint8 array holding the packets
+    # @param start_A: int64 array of the position of each packet in buf
+    # @param length_A: int64 array of the length of each packet
+    def __init__(self, buf, start_A, length_A):
+        self.buf = buf
+        self.start_A = start_A
+        self.length_A = length_A
+
+    # called when printing the object
+    def __str__(self):
+        return 'PacketBatch of %d packets' % len(self)
+
+    def __len__(self):
+        return len(self.length_A)
+
+    # @param pkt_L: binary packets, e.g. from Interface.get_batch
+    # @return PacketBatch
+    @classmethod
+    def from_packets(cls, pkt_L):
+        check()
+        length_A = np.fromiter(map(len, pkt_L), np.int64, len(pkt_L))
+        start_A = np.cumsum(length_A) - length_A
+        return cls(np.frombuffer(b''.join(pkt_L), np.uint8), start_A, length_A)
+
+    # the packets as byte strings, to put on interfaces
+    def packets(self):
+        # copy only the bytes of this batch's packets, the array may be shared with other batches
+        byte_S = gather(self.buf, self.start_A, self.start_A + self.length_A).tobytes()
+        end_L = np.cumsum(self.length_A).tolist()
+        return [byte_S[e - n:e] for e, n in zip(end_L, self.length_A.tolist())]
+
+    # decode all headers
+    # @return structured array of header_dtype, one element per packet
+    def headers(self):
+        header_length = header_dtype.itemsize
+        if (self.length_A < header_length).any():
+            raise ValueError('packet shorter than a %d byte header' % header_length)
+        byte_A = self.buf[self.start_A[:, None] + np.arange(header_length)]
+        return byte_A.view(header_dtype).reshape(len(self))
+
+    # the packets at some indices
+    # @param index_A: integer or boolean index array
+    # @return PacketBatch sharing the byte array
+    def select(self, index_A):
+        return PacketBatch(self.buf, self.start_A[index_A], self.length_A[index_A])
+
+
+# Forwards batches of packets for a router, see the module description.
+class BatchForwarder:
+
+    # @param router: network_3.Router whose routing table and outgoing interfaces are used
+    def __init__(self, router):
+        check()
+        self.router = router
+        self.version = None  # routing table and MTU versions the arrays below were built from
+        self.start_A = None  # compiled routing table interval starts
+        self.intf_A = None  # outgoing interface of each interval, -1 for no route
+        self.mtu_A = None  # MTU of each outgoing interface
+
+    # called when printing the object
+    def __str__(self):
+        return 'BatchForwarder of %s' % self.router
+
+    # rebuild the lookup arrays if the routes or MTUs changed
+    def compile(self):
+        table = self.router.routing_table
+        version = (table.version, network.Interface.mtu_version)
+        if version == self.version:
+            return
+        index = table.index
+        if index is None:
+            index = table.compile()
+        start_L, intf_L = index
+        self.start_A = np.array(start_L, np.int64)
+        self.intf_A = np.array([-1 if intf is None else intf for intf in intf_L], np.int64)
+        self.mtu_A = np.array([intf.mtu for intf in self.router.out_intf_L], np.int64)
+        self.version = version
+
+    # forward a batch of packets that arrived on one interface
+    # @param batch: PacketBatch
+    # @param src: incoming interface number, for traces and logs
+    # @return {outgoing interface number: PacketBatch of the packets and fragments to send on it, in order}
+    def forward(self, batch, src=0):
+        self.compile()
+        router = self.router
+        header_length = header_dtype.itemsize
+        length_A = batch.length_A
+        # packets shorter than a header are dropped as malformed, as by Router.forward_packet, the others forwarded
+        malformed_A = length_A < header_length
+        if malformed_A.any():
+            header_A = np.zeros(len(batch), header_dtype)
+            header_A[~malformed_A] = batch.select(~malformed_A).headers()
+        else:
+            header_A = batch.headers()
+        # outgoing interface and MTU of every packet
+        out_A = self.intf_A[np.searchsorted(self.start_A, header_A['dst_addr'].astype(np.int64), side='right') - 1]
+        out_A[malformed_A] = -1
+        routed_A = out_A >= 0
+        mtu_A = np.where(routed_A, self.mtu_A[out_A], 0)
+        split_A = routed_A & (length_A > mtu_A)
+        too_small_A = split_A & (mtu_A <= header_length)
+        keep_A = routed_A & ~too_small_A
+        split_A &= keep_A
+        # packets that fit are sent as they are, from the batch's own byte array; the others are cut into
+        # pieces of seg_A payload bytes each, the fragments, which are written to a new byte array
+        payload_A = length_A - header_length
+        seg_A = np.where(split_A, mtu_A - header_length, 1)
+        count_A = np.where(split_A, (payload_A - 1) // seg_A + 1, keep_A.astype(np.int64))
+        # one row per packet sent: its original packet and its number among the pieces of the packet
+        parent_A = np.repeat(np.arange(len(batch)), count_A)
+        piece_A = np.arange(len(parent_A)) - np.repeat(np.cumsum(count_A) - count_A, count_A)
+        row_start_A = batch.start_A[parent_A]
+        row_length_A = length_A[parent_A]
+        buf = batch.buf
+        frag_row_A = np.flatnonzero(split_A[parent_A])
+        if len(frag_row_A):
+            frag_parent_A = parent_A[frag_row_A]
+            frag_piece_A = piece_A[frag_row_A]
+            frag_off_A = frag_piece_A * seg_A[frag_parent_A]
+            frag_length_A = np.minimum(seg_A[frag_parent_A], payload_A[frag_parent_A] - frag_off_A) + header_length
+            frag_header_A = header_A[frag_parent_A]
+            frag_header_A['offset'] += frag_off_A.astype(np.uint32)
+            frag_header_A['flag'] |= (frag_piece_A < count_A[frag_parent_A] - 1).astype(np.uint8)
+            # the fragments' payloads are the payloads of the split packets, in order
+            frag_start_A = np.cumsum(frag_length_A) - frag_length_A
+            frag_buf = np.empty(int(frag_length_A.sum()), np.uint8)
+            frag_buf[frag_start_A[:, None] + np.arange(header_length)] = (
+                frag_header_A.view(np.uint8).reshape(-1, header_length))
+            frag_buf[spans(len(frag_buf), frag_start_A + header_length, frag_start_A + frag_length_A)] = gather(
+                buf, batch.start_A[split_A] + header_length, batch.start_A[split_A] + length_A[split_A])
+            row_start_A[frag_row_A] = frag_start_A + len(buf)
+            row_length_A[frag_row_A] = frag_length_A
+            buf = np.concatenate((buf, frag_buf))
+        # split the result by outgoing interface, keeping the arrival order
+        row_out_A = out_A[parent_A]
+        order_A = np.argsort(row_out_A, kind='stable')
+        row_start_A, row_length_A = row_start_A[order_A], row_length_A[order_A]
+        bound_L = np.searchsorted(row_out_A[order_A], np.arange(len(router.out_intf_L) + 1)).tolist()
+        out_D = {}
+        for dst in range(len(router.out_intf_L)):
+            lo, hi = bound_L[dst], bound_L[dst + 1]
+            if lo < hi:
+                out_D[dst] = PacketBatch(buf, row_start_A[lo:hi], row_length_A[lo:hi])
+        out_count = len(parent_A)
+        self.report(batch, src, header_A, malformed_A, routed_A, too_small_A, split_A, mtu_A, out_D, out_count)
+        return out_D
+
+    # log, feed back path MTUs, trace and count the outcome of forward
+    def report(self, batch, src, header_A, malformed_A, routed_A, too_small_A, split_A, mtu_A, out_D, out_count):
+        router = self.router
+        malformed_count = int(malformed_A.sum())
+        no_route_count = int((~routed_A).sum()) - malformed_count
+        too_small_count = int(too_small_A.sum())
+        split_count = int(split_A.sum())
+        fragment_count = out_count - (len(batch) - malformed_count - no_route_count - too_small_count - split_count)
+        if malformed_count:
+            log(ERROR, '%s: %d packets on interface %d shorter than a header, dropping', router, malformed_count, src)
+        if no_route_count:
+            log(ERROR, '%s: no route for %d packets on interface %d, dropping', router, no_route_count, src)
+        if too_small_count:
+            log(ERROR, '%s: %d packets on interface %d routed to interfaces too small for a header, dropping',
+                router, too_small_count, src)
+        log(DEBUG, '%s: forwarded %d packets from interface %d as %d packets', router, len(batch), src, out_count)
+        if split_count and router.pmtu_feedback is not None:
+            report_A = np.unique(np.stack([header_A['src_addr'][split_A].astype(np.int64),
+                                           header_A['dst_addr'][split_A].astype(np.int64), mtu_A[split_A]]), axis=1)
+            for src_addr, dst_addr, mtu in report_A.T.tolist():
+                router.pmtu_feedback(src_addr, dst_addr, mtu)
+        if packet_trace.writer is not None:
+            dropped_A = ~routed_A | too_small_A
+            for pkt_S, dropped in zip(batch.packets(), dropped_A.tolist()):
+                packet_trace.writer.record(router, src, packet_trace.RX, pkt_S)
+                if dropped:
+                    packet_trace.writer.record(router, src, packet_trace.DROP, pkt_S)
+            for dst, out in out_D.items():
+                for pkt_S in out.packets():
+                    packet_trace.writer.record(router, dst, packet_trace.TX, pkt_S)
+        m = metrics.collector
+        if m is not None:
+            slot_L = m.slots(router)
+            slot_L[metrics.PKTS_IN] += len(batch)
+            slot_L[metrics.BYTES_IN] += int(batch.length_A.sum())
+            slot_L[metrics.PKTS_OUT] += out_count
+            slot_L[metrics.BYTES_OUT] += sum(int(out.length_A.sum()) for out in out_D.values())
+            slot_L[metrics.DROP_NO_ROUTE] += no_route_count
+            slot_L[metrics.DROP_MALFORMED] += malformed_count
+            slot_L[metrics.DROP_MTU] += too_small_count
+            slot_L[metrics.FRAGMENTS] += fragment_count
+
+    # put the result of forward on the router's outgoing interfaces
+    # @param out_D: {outgoing interface number: PacketBatch}
+    # @return the number of packets that did not fit their interface
+    def deliver(self, out_D):
+        lost = 0
+        for dst, out in out_D.items():
+            pkt_L = out.packets()
+            count = self.router.out_intf_L[dst].put_batch(pkt_L)
+            if count < len(pkt_L):
+                log(ERROR, '%s: %d packets lost on interface %d', self.router, len(pkt_L) - count, dst)
+                lost += len(pkt_L) - count
+                if packet_trace.writer is not None:
+                    for pkt_S in pkt_L[count:]:
+                        packet_trace.writer.record(self.router, dst, packet_trace.DROP, pkt_S)
+        if lost and metrics.collector is not None:
+            metrics.collector.drop(self.router, metrics.DROP_FULL, lost)
+        return lost
+
+    # forward packets that arrived on one interface and put them on the outgoing interfaces
+    # @param pkt_L: binary packets
+    # @param src: incoming interface number
+    # @return the number of packets that did not fit their interface
+    def forward_packets(self, pkt_L, src=0):
+        return self.deliver(self.forward(PacketBatch.from_packets(pkt_L), src))
+
+# EOF
@@ -0,0 +1,303 @@
+# benchmark.py
+'''
+Throughput and latency benchmarks of the stage 3 data plane (network_3, link_3).
+
+Each run builds a topology, sends a number of messages of one payload size
+across it and waits until all of them are reassembled at their destinations.
+A run is made twice: a timed pass, reporting packets and bytes per second and
+message latency percentiles, and an accounting pass with the metrics counters
+and tracemalloc on, reporting the packets on the wire, the fragmentation
+overhead and the peak memory allocated.
+
+Scenarios:
+    single_path  host - router - host
+    diamond      the topology of simulation_3.py, two flows over two paths
+    fan_in       fan_in_hosts hosts sending through one router to one host
+
+Results are printed one run per line and written as JSON with --output. With
+--baseline, the packets per second of each run are compared to an earlier
+JSON output and the exit status is 1 if any run got slower than the tolerance.
+
+Usage: python benchmark.py [--scenario NAME ...] [--payload BYTES ...] [--mtu BYTES ...]
+    [--messages N] [--mode events|threads] [--core-mtu-factor F] [--pmtu] [--output FILE] [--baseline FILE]
+'''
+
+import argparse
+import json
+import platform
+import sys
+import threading
+import time
+import tracemalloc
+import link_3 as link
+import metrics
+import network_3 as network
+import path_mtu
+import rlog
+import simulator
+
+scenario_L = ['single_path', 'diamond', 'fan_in']
+fan_in_hosts = 4
+core_mtu_factor = 1  # router to router links get mtu * core_mtu_factor, < 1 makes routers refragment
+
+
+# A topology under test, with the flows to send over it.
+class Scenario:
+
+    # @param name: one of scenario_L
+    # @param mtu: MTU of the links
+    # @param intf_class: interface class of the hosts and routers
+    # @param pmtu: True to turn path MTU discovery on
+    def __init__(self, name, mtu, intf_class=network.Interface, pmtu=False):
+        self.name = name
+        self.host_L = []
+        self.router_L = []
+        self.link_layer = link.LinkLayer(batch_pkts=8)
+        self.flow_L = []  # (source host, destination address)
+        core_mtu = max(int(mtu * core_mtu_factor), network.NetworkPacket.header_length() + 1)
+        getattr(self, 'build_' + name)(mtu, core_mtu, intf_class)
+        if pmtu:
+            path_mtu.enable(self.host_L, self.router_L)
+
+    # all the objects to run
+    def object_L(self):
+        return self.host_L + self.router_L + [self.link_layer]
+
+    def add_host(self, addr, intf_class):
+        host = network.Host(addr, intf_class=intf_class)
+        self.host_L.append(host)
+        return host
+
+    def add_router(self, name, intf_count, routing_table, intf_class):
+        router = network.Router(name, intf_count, 0, routing_table, intf_class=intf_class)
+        self.router_L.append(router)
+        return router
+
+    def build_single_path(self, mtu, core_mtu, intf_class):
+        src = self.add_host(1, intf_class)
+        dst = self.add_host(2, intf_class)
+        router = self.add_router('A', 1, {2: 0}, intf_class)
+        self.link_layer.add_link(link.Link(src, 0, router, 0, mtu))
+        self.link_layer.add_link(link.Link(router, 0, dst, 0, mtu))
+        self.flow_L = [(src, 2)]
+
+    def build_diamond(self, mtu, core_mtu, intf_class):
+        client1 = self.add_host(1, intf_class)
+        client2 = self.add_host(2, intf_class)
+        server1 = self.add_host(3, intf_class)
+        server2 = self.add_host(4, intf_class)
+        router_a = self.add_router('A', 2, {3: 0, 4: 1}, intf_class)
+        router_b = self.add_router('B', 1, {3: 0, 4: 0}, intf_class)
+        router_c = self.add_router('C', 1, {3: 0, 4: 0}, intf_class)
+        router_d = self.add_router('D', 2, {3: 0, 4: 1}, intf_class)
+        self.link_layer.add_link(link.Link(client1, 0, router_a, 0, mtu))
+        self.link_layer.add_link(link.Link(client2, 0, router_a, 1, mtu))
+        self.link_layer.add_link(link.Link(router_d, 0, server1, 0, mtu))
+        self.link_layer.add_link(link.Link(router_d, 1, server2, 0, mtu))
+        self.link_layer.add_link(link.Link(router_a, 0, router_b, 0, core_mtu))
+        self.link_layer.add_link(link.Link(router_a, 1, router_c, 0, core_mtu))
+        self.link_layer.add_link(link.Link(router_b, 0, router_d, 0, core_mtu))
+        self.link_layer.add_link(link.Link(router_c, 0, router_d, 1, core_mtu))
+        self.flow_L = [(client1, 3), (client2, 4)]
+
+    def build_fan_in(self, mtu, core_mtu, intf_class):
+        src_L = [self.add_host(i + 1, intf_class) for i in range(fan_in_hosts)]
+        dst = self.add_host(fan_in_hosts + 1, intf_class)
+        router = self.add_router('A', fan_in_hosts, {fan_in_hosts + 1: 0}, intf_class)
+        for i, src in enumerate(src_L):
+            self.link_layer.add_link(link.Link(src, 0, router, i, mtu))
+        self.link_layer.add_link(link.Link(router, 0, dst, 0, core_mtu))
+        self.flow_L = [(src, fan_in_hosts + 1) for src in src_L]
+
+
+# Sends the messages of a run and collects their latencies as they are delivered.
+class Workload:
+
+    # @param scenario: Scenario to send over
+    # @param payload_bytes: size of each message
+    # @param messages: number of messages, spread over the flows of the scenario
+    def __init__(self, scenario, payload_bytes, messages):
+        self.scenario = scenario
+        self.data_S = 'x' * payload_bytes
+        self.send_L = [scenario.flow_L[i % len(scenario.flow_L)] + (i,) for i in range(messages)]
+        self.sent_D = {}  # (source address, id) -> send time
+        self.latency_L = []
+        self.done = threading.Event()
+        for host in scenario.host_L:
+            host.add_receiver(self.received)
+
+    # send one message
+    # @param src: source host
+    # @param dst_addr: destination address
+    # @param id: datagram id
+    def send(self, src, dst_addr, id):
+        self.sent_D[(src.addr, id)] = time.perf_counter()
+        src.udt_send(dst_addr, self.data_S, id)
+
+    # Host receiver callback
+    def received(self, src_addr, id, data_S):
+        sent = self.sent_D.pop((src_addr, id), None)
+        if sent is None:
+            return
+        self.latency_L.append(time.perf_counter() - sent)
+        if len(self.latency_L) == len(self.send_L):
+            self.done.set()
+
+    # send everything on the discrete-event simulator, window messages per virtual second
+    # @return False if some messages were not delivered
+    def run_events(self, window):
+        sim = simulator.Simulator(self.scenario.object_L())
+        for i, (src, dst_addr, id) in enumerate(self.send_L):
+            sim.at(i // window, self.send, src, dst_addr, id)
+        sim.run()
+        return self.done.is_set()
+
+    # send everything from this thread while the objects run a thread each
+    # @param timeout: seconds to wait for the messages to be delivered
+    # @return False if some messages were not delivered in time
+    def run_threads(self, timeout):
+        object_L = self.scenario.object_L()
+        thread_L = [threading.Thread(name=str(o), target=o.run) for o in object_L]
+        for t in thread_L:
+            t.start()
+        for src, dst_addr, id in self.send_L:
+            self.send(src, dst_addr, id)
+        delivered = self.done.wait(timeout)
+        for o in object_L:
+            o.stop = True
+        for t in thread_L:
+            t.join()
+        return delivered
+
+
+# value below which a fraction of the sorted values fall, nearest rank
+def percentile(sorted_L, fraction):
+    if not sorted_L:
+        return None
+    return sorted_L[min(len(sorted_L) - 1, int(fraction * len(sorted_L)))]
+
+
+# make one pass of a run
+# @return (Workload, seconds taken)
+def run_pass(args, scenario_name, payload_bytes, mtu):
+    scenario = Scenario(scenario_name, mtu, pmtu=args.pmtu)
+    workload = Workload(scenario, payload_bytes, args.messages)
+    start = time.perf_counter()
+    if args.mode == 'threads':
+        delivered = workload.run_threads(args.timeout)
+    else:
+        delivered = workload.run_events(args.window)
+    seconds = time.perf_counter() - start
+    if not delivered:
+        print('%s: %d of %d messages delivered' % (scenario_name, len(workload.latency_L), args.messages),
+              file=sys.stderr)
+    return workload, seconds
+
+
+# time and account one scenario, payload size and MTU
+# @return dictionary of results
+def run(args, scenario_name, payload_bytes, mtu):
+    workload, seconds = run_pass(args, scenario_name, payload_bytes, mtu)
+    latency_L = sorted(workload.latency_L)
+    # accounting pass
+    metrics.start()
+    if args.memory:
+        tracemalloc.start()
+    run_pass(args, scenario_name, payload_bytes, mtu)
+    peak_memory = tracemalloc.get_traced_memory()[1] if args.memory else None
+    tracemalloc.stop()
+    snapshot_D = metrics.stop()
+    sent_L = [snapshot_D.get('Host_%d' % src.addr, {}) for src in workload.scenario.host_L]
+    wire_pkts = sum(counter_D.get('pkts_out', 0) for counter_D in sent_L)
+    wire_bytes = sum(counter_D.get('bytes_out', 0) for counter_D in sent_L)
+    hop_pkts = sum(snapshot_D.get(str(router), {}).get('pkts_in', 0) for router in workload.scenario.router_L)
+    payload_total = payload_bytes * len(latency_L)
+    return {
+        'scenario': scenario_name,
+        'payload_bytes': payload_bytes,
+        'mtu': mtu,
+        'messages': args.messages,
+        'delivered': len(latency_L),
+        'seconds': seconds,
+        'pkts_per_sec': hop_pkts / seconds if seconds else None,
+        'bytes_per_sec': payload_total / seconds if seconds else None,
+        'latency_us': {name: percentile(latency_L, fraction) * 1e6 if latency_L else None
+                       for name, fraction in [('p50', 0.5), ('p90', 0.9), ('p99', 0.99), ('max', 1.0)]},
+        'wire_pkts_per_msg': wire_pkts / args.messages,
+        'router_pkts_per_msg': hop_pkts / args.messages,
+        'header_overhead': (wire_bytes - payload_bytes * args.messages) / (payload_bytes * args.messages),
+        'peak_memory_bytes': peak_memory,
+    }
+
+
+# compare runs to a baseline
+# @return list of messages about the runs that got slower than the tolerance
+def regressions(result_L, baseline_L, tolerance):
+    key = lambda r: (r['scenario'], r['payload_bytes'], r['mtu'])
+    baseline_D = {key(r): r for r in baseline_L}
+    message_L = []
+    for r in result_L:
+        b = baseline_D.get(key(r))
+        if b is None or not b['pkts_per_sec'] or r['pkts_per_sec'] is None:
+            continue
+        change = r['pkts_per_sec'] / b['pkts_per_sec'] - 1
+        if change < -tolerance:
+            message_L.append('%s payload=%d mtu=%d: %.0f pkts/s, %.1f%% below the baseline %.0f pkts/s'
+                             % (key(r) + (r['pkts_per_sec'], -100 * change, b['pkts_per_sec'])))
+    return message_L
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description='Benchmark the stage 3 data plane.')
+    parser.add_argument('--scenario', nargs='+', choices=scenario_L, default=scenario_L)
+    parser.add_argument('--payload', nargs='+', type=int, default=[64, 512, 4096], help='message sizes in bytes')
+    parser.add_argument('--mtu', nargs='+', type=int, default=[50, 200, 1500], help='link MTUs in bytes')
+    parser.add_argument('--messages', type=int, default=1000, help='messages per run')
+    parser.add_argument('--mode', choices=['events', 'threads'], default='events',
+                        help='discrete-event simulator or a thread per object')
+    parser.add_argument('--window', type=int, default=16, help='messages sent at a time in the events mode')
+    parser.add_argument('--timeout', type=float, default=60, help='seconds to wait for delivery in the threads mode')
+    parser.add_argument('--core-mtu-factor', type=float, default=core_mtu_factor,
+                        help='MTU of the links after the first hop relative to --mtu, < 1 makes routers refragment')
+    parser.add_argument('--pmtu', action='store_true', help='turn path MTU discovery on')
+    parser.add_argument('--no-memory', dest='memory', action='store_false', help='do not trace memory allocations')
+    parser.add_argument('--output', help='file to write the results to as JSON')
+    parser.add_argument('--baseline', help='JSON results to compare packets per second to')
+    parser.add_argument('--tolerance', type=float, default=0.1, help='slowdown over the baseline tolerated')
+    return parser.parse_args(argv)
+
+
+def main(argv):
+    global core_mtu_factor
+    args = parse_args(argv)
+    core_mtu_factor = args.core_mtu_factor
+    rlog.set_level(rlog.OFF)
+    result_L = []
+    for scenario_name in args.scenario:
+        for mtu in args.mtu:
+            for payload_bytes in args.payload:
+                r = run(args, scenario_name, payload_bytes, mtu)
+                result_L.append(r)
+                print('%-11s payload=%-5d mtu=%-5d %9.0f pkts/s %11.0f B/s  p50=%.0fus p99=%.0fus  '
+                      'pkts/msg=%.1f overhead=%.1f%%  peak=%s'
+                      % (scenario_name, payload_bytes, mtu, r['pkts_per_sec'] or 0, r['bytes_per_sec'] or 0,
+                         r['latency_us']['p50'] or 0, r['latency_us']['p99'] or 0, r['wire_pkts_per_msg'],
+                         100 * r['header_overhead'], r['peak_memory_bytes']))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'python': platform.python_version(), 'mode': args.mode,
+                       'wire_format': network.NetworkPacket.wire_format, 'results': result_L}, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            message_L = regressions(result_L, json.load(f)['results'], args.tolerance)
+        for message in message_L:
+            print('REGRESSION ' + message)
+        if message_L:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
+
+# EOF
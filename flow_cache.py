@@ -0,0 +1,52 @@
+# flow_cache.py
+
+from collections import OrderedDict
+
+
+# Least recently used cache of forwarding decisions, keyed by destination
+# address: the outgoing interface number and its MTU (None for no route), so
+# that a packet of a known destination costs a dict lookup instead of a
+# routing table lookup. The owner passes the versions of everything the
+# decisions were made from (routing table, MTUs) to validate, which empties
+# the cache when they differ from last time.
+class FlowCache:
+
+    # @param max_entries: number of destinations remembered
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self.entry_D = OrderedDict()  # key -> (interface number, MTU), least recently used first
+        self.version = None
+        self.miss_count = 0
+        self.eviction_count = 0
+
+    # called when printing the object
+    def __str__(self):
+        return 'FlowCache of %d/%d entries' % (len(self.entry_D), self.max_entries)
+
+    # empty the cache if what the decisions were made from changed
+    # @param version: any comparable value that changes whenever the routes or MTUs change
+    def validate(self, version):
+        if version != self.version:
+            self.entry_D.clear()
+            self.version = version
+
+    # @return the cached (interface number, MTU), None if not cached
+    def get(self, key):
+        entry = self.entry_D.get(key)
+        if entry is not None:
+            self.entry_D.move_to_end(key)
+        return entry
+
+    # remember a decision, evicting the least recently used one if full
+    # @param entry: (interface number, MTU), interface number None for no route
+    def put(self, key, entry):
+        self.miss_count += 1
+        self.entry_D[key] = entry
+        if len(self.entry_D) > self.max_entries:
+            self.entry_D.popitem(last=False)
+            self.eviction_count += 1
+
+    def __len__(self):
+        return len(self.entry_D)
+
+# EOF
@@ -0,0 +1,26 @@
+# fragmentation.py
+
+
+# Split a payload into fragments that fit an MTU, used by hosts sending
+# datagrams and by routers refragmenting packets for smaller links.
+# Fragment boundaries are computed up front and each fragment is a slice of
+# the original payload; binary payloads are sliced through a memoryview, so
+# the payload is never copied and large datagrams fragment in linear time.
+# @param data_S: payload to fragment (str, bytes or memoryview)
+# @param mtu: maximum packet length, header included
+# @param header_length: length of the packet header
+# @param offset: offset of data_S in its datagram, non-zero when refragmenting a fragment
+# @param more: True if data_S is itself followed by more fragments of its datagram
+# @return generator of (offset, flag, payload) tuples, flag is 1 if more fragments follow
+def fragment(data_S, mtu, header_length, offset=0, more=False):
+    size = mtu - header_length
+    if size <= 0:
+        raise ValueError('MTU %d leaves no room for payload after a %d byte header' % (mtu, header_length))
+    if not isinstance(data_S, str):
+        data_S = memoryview(data_S)
+    # start of the last fragment; an empty payload still makes one (empty) fragment
+    last = max(len(data_S) - 1, 0) // size * size
+    for start in range(0, last + 1, size):
+        yield offset + start, int(more or start < last), data_S[start:start + size]
+
+# EOF
@@ -1,8 +1,12 @@
 # link_3.py
 
+import aqm
+import metrics
+import packet_trace
 import queue
-import threading
-from rprint import print
+from rlog import log, DEBUG, ERROR
+from runnable import Runnable
+from scheduler import Scheduler
 
 
 # An abstraction of a link between router interfaces
@@ -14,7 +18,12 @@ class Link:
     # @param to_node: node to which data will be transfered
     # @param to_intf_num: number of the interface on that node
     # @param mtu: link maximum transmission unit
-    def __init__(self, from_node, from_intf_num, to_node, to_intf_num, mtu):
+    # @param batch_pkts: packets the link may move per transfer pass, None for the LinkLayer default
+    # @param batch_bytes: bytes the link may move per transfer pass, None for the LinkLayer default
+    # @param bandwidth: link bandwidth in bytes per second, None for the LinkLayer default
+    # @param delay: propagation delay in seconds, None for the LinkLayer default
+    def __init__(self, from_node, from_intf_num, to_node, to_intf_num, mtu, batch_pkts=None, batch_bytes=None,
+                 bandwidth=None, delay=None):
         self.from_node = from_node
         self.from_intf_num = from_intf_num
         self.to_node = to_node
@@ -24,38 +33,123 @@ class Link:
         # configure the MTUs of linked interfaces
         self.in_intf.mtu = mtu
         self.out_intf.mtu = mtu
+        # batch policy
+        self.batch_pkts = batch_pkts
+        self.batch_bytes = batch_bytes
+        # transmission model
+        self.bandwidth = bandwidth
+        self.delay = delay
+        self.busy_until = 0  # time at which the link finishes transmitting its current packet
+        self.scheduler = None  # set by LinkLayer.add_link, delivers packets in flight
     
     # called when printing the object
     def __str__(self):
         return 'Link %s-%d to %s-%d' % (self.from_node, self.from_intf_num, self.to_node, self.to_intf_num)
     
-    # transmit a packet from the 'from' to the 'to' interface
+    # transmit a batch of packets from the 'from' to the 'to' interface
+    # @return the number of packets taken off the 'from' interface
     def tx_pkt(self):
-        pkt_S = self.in_intf.get()
-        if pkt_S is None:
-            return  # return if no packet to transfer
-        if len(pkt_S) > self.in_intf.mtu:
-            print('%s: packet "%s" length greater than the from interface MTU (%d)' % (self, pkt_S, self.out_intf.mtu))
-            return  # return without transmitting if packet too big
-        if len(pkt_S) > self.out_intf.mtu:
-            print('%s: packet "%s" length greater than the to interface MTU (%d)' % (self, pkt_S, self.out_intf.mtu))
-            return  # return without transmitting if packet too big
-        # otherwise transmit the packet
+        if self.bandwidth is None:
+            pkt_L = self.in_intf.get_batch(self.batch_pkts, self.batch_bytes)
+        elif self.busy_until > self.scheduler.clock():
+            return 0  # still transmitting the previous packet
+        else:
+            pkt_L = self.in_intf.get_batch(1)
+        m = metrics.collector
+        send_L = []
+        for pkt_S in pkt_L:
+            if m is not None:
+                m.pkt_in(self, pkt_S)
+            if len(pkt_S) > self.in_intf.mtu:
+                log(ERROR, '%s: packet "%s" length greater than the from interface MTU (%d)', self, pkt_S, self.out_intf.mtu)
+                if packet_trace.writer is not None:
+                    packet_trace.writer.record(self, self.from_intf_num, packet_trace.DROP, pkt_S)
+                if m is not None:
+                    m.drop(self, metrics.DROP_MTU)
+                continue  # do not transmit if packet too big
+            if len(pkt_S) > self.out_intf.mtu:
+                log(ERROR, '%s: packet "%s" length greater than the to interface MTU (%d)', self, pkt_S, self.out_intf.mtu)
+                if packet_trace.writer is not None:
+                    packet_trace.writer.record(self, self.from_intf_num, packet_trace.DROP, pkt_S)
+                if m is not None:
+                    m.drop(self, metrics.DROP_MTU)
+                continue  # do not transmit if packet too big
+            send_L.append(pkt_S)
+        if self.bandwidth is not None or self.delay:
+            self.schedule(send_L)
+            return len(pkt_L)
+        if self.out_intf.drop_policy is not None:
+            # the policy may drop any of the packets, not just those beyond the room left
+            for pkt_S in send_L:
+                self.deliver(pkt_S)
+            return len(pkt_L)
+        # otherwise transmit the packets
+        sent = self.out_intf.put_batch(send_L)
+        for pkt_S in send_L[:sent]:
+            log(DEBUG, '%s: transmitting packet "%s"', self, pkt_S)
+        for pkt_S in send_L[sent:]:
+            log(ERROR, '%s: packet lost', self)
+        if packet_trace.writer is not None:
+            for pkt_S in send_L[:sent]:
+                packet_trace.writer.record(self, self.to_intf_num, packet_trace.LINK, pkt_S)
+            for pkt_S in send_L[sent:]:
+                packet_trace.writer.record(self, self.to_intf_num, packet_trace.DROP, pkt_S)
+        if m is not None:
+            for pkt_S in send_L[:sent]:
+                m.pkt_out(self, pkt_S)
+            if sent < len(send_L):
+                m.drop(self, metrics.DROP_FULL, len(send_L) - sent)
+        return len(pkt_L)
+    
+    # put packets in flight: each is delivered once it has been transmitted at the
+    # link bandwidth (one after another) and has propagated across the link
+    # @param pkt_L: packets to transmit
+    def schedule(self, pkt_L):
+        now = self.scheduler.clock()
+        for pkt_S in pkt_L:
+            arrival = now
+            if self.bandwidth is not None:
+                self.busy_until = max(now, self.busy_until) + len(pkt_S) / self.bandwidth
+                arrival = self.busy_until
+                self.scheduler.schedule(self.busy_until, (self, None))  # transmit the next packet then
+            self.scheduler.schedule(arrival + self.delay, (self, pkt_S))
+    
+    # deliver a packet that finished crossing the link to the 'to' interface
+    # @param pkt_S: packet to deliver
+    def deliver(self, pkt_S):
         try:
             self.out_intf.put(pkt_S)
-            print('%s: transmitting packet "%s"' % (self, pkt_S))
+            log(DEBUG, '%s: transmitting packet "%s"', self, pkt_S)
+            if packet_trace.writer is not None:
+                packet_trace.writer.record(self, self.to_intf_num, packet_trace.LINK, pkt_S)
+            if metrics.collector is not None:
+                metrics.collector.pkt_out(self, pkt_S)
+        except aqm.PolicyDrop:
+            log(DEBUG, '%s: packet "%s" dropped by the drop policy of the to interface', self, pkt_S)
         except queue.Full:
-            print('%s: packet lost' % (self))
-            pass
+            log(ERROR, '%s: packet lost', self)
+            if packet_trace.writer is not None:
+                packet_trace.writer.record(self, self.to_intf_num, packet_trace.DROP, pkt_S)
+            if metrics.collector is not None:
+                metrics.collector.drop(self, metrics.DROP_FULL)
 
 
 # An abstraction of the link layer
-class LinkLayer:
+class LinkLayer(Runnable):
     
-    def __init__(self):
+    # @param batch_pkts: packets each link may move per transfer pass, unless set on the link
+    # @param batch_bytes: bytes each link may move per transfer pass, None for no limit
+    # @param bandwidth: bandwidth of each link in bytes per second, unless set on the link; None for unlimited
+    # @param delay: propagation delay of each link in seconds, unless set on the link
+    def __init__(self, batch_pkts=1, batch_bytes=None, bandwidth=None, delay=0):
+        Runnable.__init__(self)
         # list of links in the network
         self.link_L = []
-        self.stop = False  # for thread termination
+        self.batch_pkts = batch_pkts
+        self.batch_bytes = batch_bytes
+        self.bandwidth = bandwidth
+        self.delay = delay
+        self.scheduler = Scheduler()  # packets in flight, ordered by delivery time
     
     # Return a name of the network layer
     def __str__(self):
@@ -63,22 +157,42 @@ class LinkLayer:
     
     # add a Link to the network
     def add_link(self, link):
+        if link.batch_pkts is None:
+            link.batch_pkts = self.batch_pkts
+        if link.batch_bytes is None:
+            link.batch_bytes = self.batch_bytes
+        if link.bandwidth is None:
+            link.bandwidth = self.bandwidth
+        if link.delay is None:
+            link.delay = self.delay
+        link.scheduler = self.scheduler
         self.link_L.append(link)
+        link.in_intf.add_listener(self.notify)  # wake up when a packet is sent on the link
     
-    # transfer a packet across all links
+    # transfer a batch of packets across all links
+    # @return the number of packets taken off the links' 'from' interfaces
     def transfer(self):
+        pkt_count = 0
         for link in self.link_L:
-            link.tx_pkt()
+            pkt_count += link.tx_pkt()
+        return pkt_count
+    
+    # deliver the packets that finished crossing their links
+    # @return the number of packets delivered
+    def deliver(self):
+        pkt_count = 0
+        for link, pkt_S in self.scheduler.pop_due():
+            if pkt_S is not None:  # None only marks a link done transmitting
+                link.deliver(pkt_S)
+                pkt_count += 1
+        return pkt_count
+    
+    # deliver due packets and transfer everything queued on the links, called by the thread target
+    def poll(self):
+        return self.deliver() + self.transfer()
     
-    # thread target for the network to keep transmitting data across links
-    def run(self):
-        print(threading.currentThread().getName() + ': Starting')
-        while True:
-            # transfer one packet on all the links
-            self.transfer()
-            # terminate
-            if self.stop:
-                print(threading.currentThread().getName() + ': Ending')
-                return
+    # wake up when the next packet in flight is due
+    def timeout(self):
+        return self.scheduler.timeout()
 
 # EOF
\ No newline at end of file
@@ -0,0 +1,180 @@
+# metrics.py
+'''
+Opt-in packet counters for interfaces, links, hosts and routers.
+
+Capture is started with start(); the hot paths then count the packets and
+bytes each object moves, its drops by reason, the fragments it produces, the
+high-water mark of interface queues and a histogram of the time routers take
+to forward a packet. Every thread counts into a table of its own, a dict of
+flat lists of integers, so counting takes no lock; snapshot() adds the tables
+of all threads up on demand.
+
+Forked worker processes count into their own copies of the tables, which the
+parent does not see.
+'''
+
+import threading
+
+# counter slots
+PKTS_IN = 0  # interfaces: packets enqueued, nodes: packets received, links: packets taken for transmission
+BYTES_IN = 1
+PKTS_OUT = 2  # interfaces: packets dequeued, nodes: packets sent, links: packets delivered
+BYTES_OUT = 3
+DROP_FULL = 4  # packets dropped on a full queue
+DROP_NO_ROUTE = 5  # packets dropped for lack of a route
+DROP_MTU = 6  # packets dropped for not fitting an MTU
+DROP_AQM = 7  # packets dropped by the drop policy of an interface, see aqm.py
+DROP_MALFORMED = 8  # packets dropped for a header that does not parse
+FRAGMENTS = 9  # fragments produced by splitting packets
+QUEUE_HWM = 10  # deepest queue length seen, aggregated as a maximum
+LATENCY = 11  # first slot of the forwarding latency histogram
+latency_bucket_count = 24  # bucket b counts latencies of less than 2**b microseconds, the last one the rest
+slot_count = LATENCY + latency_bucket_count
+counter_name_L = ['pkts_in', 'bytes_in', 'pkts_out', 'bytes_out', 'drop_full', 'drop_no_route', 'drop_mtu',
+                  'drop_aqm', 'drop_malformed', 'fragments', 'queue_hwm']
+
+collector = None  # the active Metrics, None when not counting
+
+
+# Per-thread counter tables, keyed by the counted object.
+class Metrics:
+
+    def __init__(self):
+        self.local = threading.local()
+        self.table_L = []  # the table of every thread that counted something
+        self.lock = threading.Lock()  # only taken when a thread counts for the first time
+
+    # the counter slots of an object in the calling thread's table
+    # @param obj: interface, link, host or router, named by its str form in snapshots
+    # @return list of slot_count integers
+    def slots(self, obj):
+        try:
+            table = self.local.table
+        except AttributeError:
+            table = self.local.table = {}
+            with self.lock:
+                self.table_L.append(table)
+        slot_L = table.get(obj)
+        if slot_L is None:
+            slot_L = table[obj] = [0] * slot_count
+        return slot_L
+
+    # count a packet coming in
+    # @param obj: counted object
+    # @param pkt_S: the packet as it travels the links
+    def pkt_in(self, obj, pkt_S):
+        slot_L = self.slots(obj)
+        slot_L[PKTS_IN] += 1
+        slot_L[BYTES_IN] += len(pkt_S)
+
+    # count a packet going out
+    # @param obj: counted object
+    # @param pkt_S: the packet as it travels the links
+    def pkt_out(self, obj, pkt_S):
+        slot_L = self.slots(obj)
+        slot_L[PKTS_OUT] += 1
+        slot_L[BYTES_OUT] += len(pkt_S)
+
+    # count dropped packets
+    # @param obj: counted object
+    # @param reason: DROP_FULL, DROP_NO_ROUTE, DROP_MTU, DROP_AQM or DROP_MALFORMED
+    # @param count: number of packets
+    def drop(self, obj, reason, count=1):
+        self.slots(obj)[reason] += count
+
+    # count fragments produced
+    # @param obj: counted object
+    # @param count: number of fragments
+    def fragments(self, obj, count):
+        self.slots(obj)[FRAGMENTS] += count
+
+    # record a queue length, keeping the deepest
+    # @param obj: counted interface
+    # @param depth: number of packets queued
+    def queue_depth(self, obj, depth):
+        slot_L = self.slots(obj)
+        if depth > slot_L[QUEUE_HWM]:
+            slot_L[QUEUE_HWM] = depth
+
+    # add a forwarding time to the histogram
+    # @param obj: counted router
+    # @param seconds: time from taking the packet off an interface to queueing it for transmission
+    def latency(self, obj, seconds):
+        bucket = int(seconds * 1e6).bit_length()
+        if bucket >= latency_bucket_count:
+            bucket = latency_bucket_count - 1
+        self.slots(obj)[LATENCY + bucket] += 1
+
+    # add the counters of all threads up
+    # @return {object name: {counter name: value, 'latency_us': {bucket upper bound: count}}},
+    #  only counters that are not 0
+    def snapshot(self):
+        with self.lock:
+            table_L = list(self.table_L)
+        total_D = {}
+        for table in table_L:
+            for obj, slot_L in list(table.items()):
+                total_L = total_D.get(obj)
+                if total_L is None:
+                    total_D[obj] = list(slot_L)
+                    continue
+                for s in range(slot_count):
+                    if s == QUEUE_HWM:
+                        total_L[s] = max(total_L[s], slot_L[s])
+                    else:
+                        total_L[s] += slot_L[s]
+        snapshot_D = {}
+        for obj, total_L in total_D.items():
+            counter_D = {counter_name_L[s]: total_L[s] for s in range(LATENCY) if total_L[s]}
+            latency_D = {1 << b: total_L[LATENCY + b] for b in range(latency_bucket_count) if total_L[LATENCY + b]}
+            if latency_D:
+                counter_D['latency_us'] = latency_D
+            snapshot_D[str(obj)] = counter_D
+        return snapshot_D
+
+    # zero every counter
+    def reset(self):
+        with self.lock:
+            for table in self.table_L:
+                for slot_L in list(table.values()):
+                    slot_L[:] = [0] * slot_count
+
+
+# start counting, replacing the counters of an earlier start
+def start():
+    global collector
+    collector = Metrics()
+
+
+# stop counting
+# @return the final snapshot, None if not counting
+def stop():
+    global collector
+    if collector is None:
+        return None
+    snapshot_D = collector.snapshot()
+    collector = None
+    return snapshot_D
+
+
+# the counters of all threads added up, see Metrics.snapshot
+# @return {} if not counting
+def snapshot():
+    if collector is None:
+        return {}
+    return collector.snapshot()
+
+
+# render a snapshot as text, one line per object
+# @param snapshot_D: as returned by snapshot
+def format_snapshot(snapshot_D):
+    line_L = []
+    for name in sorted(snapshot_D):
+        counter_D = snapshot_D[name]
+        field_L = ['%s=%s' % (counter, counter_D[counter]) for counter in counter_name_L if counter in counter_D]
+        if 'latency_us' in counter_D:
+            field_L.append('latency_us=' + ','.join('<%d:%d' % item for item in sorted(counter_D['latency_us'].items())))
+        line_L.append('%s: %s' % (name, ' '.join(field_L)))
+    return '\n'.join(line_L)
+
+# EOF
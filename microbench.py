@@ -0,0 +1,219 @@
+# microbench.py
+'''
+Micro-benchmarks of the per-packet operations of the network modules, timed
+in isolation: NetworkPacket.to_byte_S, NetworkPacket.from_byte_S, Host.udt_send
+(fragmentation) and Router.handle_frag, across payload sizes and MTUs.
+
+Each case is calibrated to a number of calls taking at least --min-time
+seconds, warmed up, then timed over --trials trials; the summary gives the
+minimum, median, mean and standard deviation of the time per call.
+
+An implementation is a network module, optionally with the wire format to set
+on its NetworkPacket, written module[:format], e.g. network_3:text. With
+--compare A B, both are timed case by case and the ratio of their medians is
+reported, e.g. to compare wire formats or a modified copy of a module with
+the original. Cases an implementation cannot run, such as payloads whose
+fragment offsets do not fit the text header, are reported as n/a.
+
+Usage: python microbench.py [--impl MODULE[:FORMAT]] [--compare A B] [--bench NAME ...]
+    [--payload BYTES ...] [--mtu BYTES ...] [--trials N] [--output FILE]
+e.g. python microbench.py --compare network_3:binary network_3:text
+'''
+
+import argparse
+import contextlib
+import importlib
+import json
+import os
+import statistics
+import sys
+import time
+import rlog
+
+bench_L = ['to_byte_S', 'from_byte_S', 'udt_send', 'handle_frag']
+
+
+# A network module under test.
+class Implementation:
+
+    # @param spec: module[:wire format]
+    def __init__(self, spec):
+        self.spec = spec
+        module_name, _, wire_format = spec.partition(':')
+        self.module = importlib.import_module(module_name)
+        self.packet_class = self.module.NetworkPacket
+        # without a format the module's default, which an implementation of the same module may change
+        self.wire_format = wire_format or getattr(self.packet_class, 'wire_format', None)
+
+    # make the module use the wire format of this implementation
+    def activate(self):
+        if self.wire_format:
+            self.packet_class.wire_format = self.wire_format
+
+    # a payload of the given size in the form the module sends
+    def payload(self, size):
+        data_S = 'x' * size
+        if hasattr(self.packet_class, 'encode_data'):
+            data_S = self.packet_class.encode_data(data_S)
+        return data_S
+
+    # header length in the active wire format
+    def header_length(self):
+        if hasattr(self.packet_class, 'header_length'):
+            return self.packet_class.header_length()
+        return self.packet_class.header_S_length
+
+    def new_host(self):
+        return self.module.Host(1)
+
+    def new_router(self):
+        try:
+            return self.module.Router('A', 1, 0, {})
+        except TypeError:
+            return self.module.Router('A', 1, 0)  # modules without routing tables
+
+
+# build the function timed by a benchmark
+# @param impl: Implementation
+# @param bench: one of bench_L
+# @param payload_bytes: payload size
+# @param mtu: MTU of the interface sent on, for udt_send and handle_frag
+# @return function taking no arguments
+def make_case(impl, bench, payload_bytes, mtu):
+    packet_class = impl.packet_class
+    data_S = impl.payload(payload_bytes)
+    if bench == 'to_byte_S':
+        p = packet_class(3, data_S, 1)
+        return p.to_byte_S
+    if bench == 'from_byte_S':
+        pkt_S = packet_class(3, data_S, 1).to_byte_S()
+        return lambda: packet_class.from_byte_S(pkt_S)
+    if bench == 'udt_send':
+        host = impl.new_host()
+        intf = host.out_intf_L[0]
+        intf.mtu = mtu
+        pkt_Q = intf.queue.queue
+
+        def send():
+            host.udt_send(3, data_S, 1)
+            pkt_Q.clear()  # the fragments are not consumed, keep the queue from growing
+        return send
+    if bench == 'handle_frag':
+        router = impl.new_router()
+        intf = router.out_intf_L[0]
+        intf.mtu = mtu
+        pkt_Q = intf.queue.queue
+
+        def forward():
+            # older modules consume the packet, so every call gets a new one
+            router.handle_frag(packet_class(3, data_S, 1), 0, 0, mtu)
+            pkt_Q.clear()
+        # routers drop the packets they cannot fragment, time only those they send
+        router.handle_frag(packet_class(3, data_S, 1), 0, 0, mtu)
+        if not pkt_Q:
+            raise ValueError('router %s dropped the packet' % router)
+        return forward
+    raise ValueError('unknown benchmark %s' % bench)
+
+
+# time a function
+# @param fn: function taking no arguments
+# @param trials: number of timed trials
+# @param warmup: number of untimed trials
+# @param min_time: seconds each trial should take at least
+# @return dictionary of statistics of the seconds per call
+def measure(fn, trials, warmup, min_time):
+    # calibrate the calls per trial, doubling until a trial takes min_time
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        if time.perf_counter() - start >= min_time:
+            break
+        number *= 2
+    for _ in range(warmup):
+        for _ in range(number):
+            fn()
+    sample_L = []
+    for _ in range(trials):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        sample_L.append((time.perf_counter() - start) / number)
+    return {
+        'calls_per_trial': number,
+        'min': min(sample_L),
+        'median': statistics.median(sample_L),
+        'mean': statistics.mean(sample_L),
+        'stdev': statistics.stdev(sample_L) if len(sample_L) > 1 else 0.0,
+    }
+
+
+# time one case of an implementation, with its printing silenced
+# @return dictionary of statistics, None if the MTU leaves no room for payload or the implementation
+#  cannot encode the packets of the case, e.g. fragment offsets too wide for the text header
+def run_case(impl, bench, payload_bytes, mtu, args):
+    impl.activate()
+    if bench in ('udt_send', 'handle_frag') and mtu <= impl.header_length():
+        return None
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        try:
+            fn = make_case(impl, bench, payload_bytes, mtu)
+            fn()  # fails before timing if the case cannot run
+        except ValueError:
+            return None
+        return measure(fn, args.trials, args.warmup, args.min_time)
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description='Time packet encoding, decoding and fragmentation.')
+    parser.add_argument('--impl', default='network_3', help='module[:wire format] to time')
+    parser.add_argument('--compare', nargs=2, metavar=('A', 'B'), help='time two implementations side by side')
+    parser.add_argument('--bench', nargs='+', choices=bench_L, default=bench_L)
+    parser.add_argument('--payload', nargs='+', type=int, default=[16, 256, 4096], help='payload sizes in bytes')
+    parser.add_argument('--mtu', nargs='+', type=int, default=[50, 1500], help='MTUs for udt_send and handle_frag')
+    parser.add_argument('--trials', type=int, default=7)
+    parser.add_argument('--warmup', type=int, default=1, help='untimed trials before the timed ones')
+    parser.add_argument('--min-time', type=float, default=0.02, help='seconds each trial takes at least')
+    parser.add_argument('--output', help='file to write the results to as JSON')
+    return parser.parse_args(argv)
+
+
+def main(argv):
+    args = parse_args(argv)
+    rlog.set_level(rlog.OFF)
+    impl_L = [Implementation(spec) for spec in (args.compare or [args.impl])]
+    result_L = []
+    for bench in args.bench:
+        # encoding and decoding do not depend on the MTU
+        mtu_L = args.mtu if bench in ('udt_send', 'handle_frag') else [None]
+        for mtu in mtu_L:
+            for payload_bytes in args.payload:
+                r = {'bench': bench, 'payload_bytes': payload_bytes, 'mtu': mtu}
+                field_L = []
+                for impl in impl_L:
+                    stats_D = run_case(impl, bench, payload_bytes, mtu, args)
+                    r[impl.spec] = stats_D
+                    if stats_D is None:
+                        field_L.append('%s: n/a' % impl.spec)
+                    else:
+                        field_L.append('%s: %8.2fus +-%5.2f (min %.2f)'
+                                       % (impl.spec, stats_D['median'] * 1e6, stats_D['stdev'] * 1e6,
+                                          stats_D['min'] * 1e6))
+                if len(impl_L) == 2 and None not in (r[impl_L[0].spec], r[impl_L[1].spec]):
+                    r['ratio'] = r[impl_L[1].spec]['median'] / r[impl_L[0].spec]['median']
+                    field_L.append('ratio %.2f' % r['ratio'])
+                result_L.append(r)
+                print('%-11s payload=%-5d mtu=%-5s %s'
+                      % (bench, payload_bytes, mtu if mtu is not None else '-', '  '.join(field_L)))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'implementations': [impl.spec for impl in impl_L], 'results': result_L}, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
+
+# EOF
@@ -1,30 +1,463 @@
 # network_3.py
 
+import asyncio
+import aqm
 import queue
+import struct
+import metrics
+import packet_trace
 import threading
-from rprint import print
+import time
+from collections import deque
+from flow_cache import FlowCache
+from fragmentation import fragment
+from path_mtu import PathMtuCache
+import rlog
+from rlog import log, DEBUG, ERROR, INFO
+from reassembly import Reassembler
+from routing_table import RoutingTable
+from runnable import Runnable
+from shm_ring import RingBuffer
 
 
 # wrapper class for a queue of packets
 class Interface:
+    mtu_version = 0  # incremented whenever the MTU of any interface changes, for flow caches
+    
     # @param max_queue_size - the maximum size of the queue storing packets
     #  @param mtu - the maximum transmission unit on this interface
     def __init__(self, max_queue_size=0):
         self.queue = queue.Queue(max_queue_size)
         self.mtu = 1
+        self.listener_L = []  # callbacks invoked whenever a packet is enqueued
+        self.name = 'Interface'  # set by the owning node, for metrics
+        self.drop_policy = None  # active queue management, see aqm.py
+    
+    # the MTU, with a version to tell flow caches when MTUs change
+    @property
+    def mtu(self):
+        return self._mtu
+    
+    @mtu.setter
+    def mtu(self, mtu):
+        self._mtu = mtu
+        Interface.mtu_version += 1
+    
+    # called when printing the object
+    def __str__(self):
+        return self.name
+    
+    # number of packets queued
+    def qsize(self):
+        return self.queue.qsize()
+    
+    # replace the FIFO queue with a scheduling discipline, while the interface is empty
+    # @param scheduler - function taking the maximum queue size and returning a queue.Queue, see qdisc.make
+    def set_scheduler(self, scheduler):
+        self.queue = scheduler(self.queue.maxsize)
+    
+    # set a policy deciding which packets to queue and which to hand on, while the interface is empty
+    # @param policy - aqm.DropPolicy of this interface alone, None to queue every packet that fits
+    def set_drop_policy(self, policy):
+        self.drop_policy = policy
+        self.queued_bytes = 0  # bytes queued, for the policy
+        self.stamp_D = {}  # id of a queued packet -> deque of the times it was queued, if the policy uses sojourn times
+        self.policy_lock = threading.Lock()  # the producer admits and the consumer keeps packets
+    
+    # ask the drop policy which packets to queue, counting those dropped
+    # @param pkt_L - arriving packets
+    # @return the packets admitted, in order
+    def admit(self, pkt_L):
+        policy = self.drop_policy
+        admit_L = []
+        with self.policy_lock:
+            qsize = self.qsize()
+            for pkt in pkt_L:
+                if policy.admit(qsize + len(admit_L), self.queued_bytes, pkt):
+                    admit_L.append(pkt)
+                    self.queued_bytes += len(pkt)
+                    if policy.uses_sojourn:
+                        self.stamp_D.setdefault(id(pkt), deque()).append(policy.clock())
+                else:
+                    policy.drops += 1
+                    self.count_drop(pkt)
+        return admit_L
+    
+    # forget admitted packets that did not fit the queue after all
+    # @param pkt_L - packets admitted but not queued
+    def unadmit(self, pkt_L):
+        with self.policy_lock:
+            for pkt in pkt_L:
+                self.queued_bytes -= len(pkt)
+                if self.drop_policy.uses_sojourn:
+                    self.pop_stamp(pkt)
+    
+    # @return the time a queued packet was queued
+    def pop_stamp(self, pkt):
+        stamp_Q = self.stamp_D[id(pkt)]
+        stamp = stamp_Q.popleft()
+        if not stamp_Q:
+            del self.stamp_D[id(pkt)]
+        return stamp
+    
+    # ask the drop policy which dequeued packets to hand on, counting those dropped
+    # @param pkt_L - packets dequeued
+    # @return the packets kept, in order
+    def keep(self, pkt_L):
+        policy = self.drop_policy
+        keep_L = []
+        with self.policy_lock:
+            qsize = self.qsize() + len(pkt_L)
+            for pkt in pkt_L:
+                qsize -= 1
+                self.queued_bytes -= len(pkt)
+                sojourn = policy.clock() - self.pop_stamp(pkt) if policy.uses_sojourn else None
+                if policy.keep(sojourn, qsize, self.queued_bytes):
+                    keep_L.append(pkt)
+                else:
+                    policy.drops += 1
+                    self.count_drop(pkt)
+        return keep_L
+    
+    # put packets one at a time until one does not fit, for put_batch under a drop policy
+    # @return the number of packets inserted or dropped by the drop policy
+    def put_each(self, pkt_L):
+        count = 0
+        for pkt in pkt_L:
+            try:
+                self.put(pkt)
+            except aqm.PolicyDrop:
+                pass  # counted by admit
+            except queue.Full:
+                break
+            count += 1
+        return count
+    
+    # trace and count a packet dropped by the drop policy
+    def count_drop(self, pkt):
+        log(DEBUG, '%s: %s dropped packet "%s"', self, self.drop_policy, pkt)
+        if packet_trace.writer is not None:
+            packet_trace.writer.record(self, 0, packet_trace.DROP, pkt)
+        if metrics.collector is not None:
+            metrics.collector.drop(self, metrics.DROP_AQM)
+    
+    # free what the interface holds outside the process, called by its owner once done with it;
+    # a queue holds nothing
+    def unlink(self):
+        pass
+    
+    # count packets enqueued and dropped, and the queue depth, when collecting metrics
+    # @param pkt_L - packets enqueued
+    # @param dropped - number of packets that did not fit
+    def count_put(self, pkt_L, dropped=0):
+        m = metrics.collector
+        for pkt in pkt_L:
+            m.pkt_in(self, pkt)
+        if dropped:
+            m.drop(self, metrics.DROP_FULL, dropped)
+        m.queue_depth(self, self.qsize())
+    
+    # count packets dequeued when collecting metrics
+    # @param pkt_L - packets dequeued
+    def count_get(self, pkt_L):
+        m = metrics.collector
+        for pkt in pkt_L:
+            m.pkt_out(self, pkt)
+    
+    # register a callback to be invoked whenever a packet is enqueued
+    # @param callback - function taking no arguments, e.g. Runnable.notify
+    def add_listener(self, callback):
+        self.listener_L.append(callback)
     
     # get packet from the queue interface
     def get(self):
+        while True:
+            try:
+                pkt = self.queue.get(False)
+            except queue.Empty:
+                return None
+            if self.drop_policy is None or self.keep((pkt,)):
+                break
+        if metrics.collector is not None:
+            self.count_get((pkt,))
+        return pkt
+    
+    # put the packet into the interface queue
+    # @param pkt - Packet to be inserted into the queue
+    # @param block - if True, block until room in queue, if False may throw queue.Full exception;
+    #  throws aqm.PolicyDrop, a queue.Full, if the drop policy drops the packet
+    def put(self, pkt, block=False):
+        if self.drop_policy is not None and not self.admit((pkt,)):
+            raise aqm.PolicyDrop
         try:
-            return self.queue.get(False)
-        except queue.Empty:
-            return None
+            self.queue.put(pkt, block)
+        except queue.Full:
+            if self.drop_policy is not None:
+                self.unadmit((pkt,))
+            if metrics.collector is not None:
+                self.count_put((), 1)
+            raise
+        if metrics.collector is not None:
+            self.count_put((pkt,))
+        for callback in self.listener_L:
+            callback()
+    
+    # get up to max_pkts packets holding the queue lock only once
+    # @param max_pkts - maximum number of packets to return
+    # @param max_bytes - stop once the packets returned add up to this many bytes, None for no limit
+    # @return list of packets, empty if the queue is empty
+    def get_batch(self, max_pkts, max_bytes=None):
+        q = self.queue
+        pkt_L = []
+        byte_count = 0
+        with q.mutex:
+            while q._qsize() and len(pkt_L) < max_pkts:
+                pkt = q._get()
+                pkt_L.append(pkt)
+                byte_count += len(pkt)
+                if max_bytes is not None and byte_count >= max_bytes:
+                    break
+            if pkt_L:
+                q.not_full.notify(len(pkt_L))
+        if pkt_L and self.drop_policy is not None:
+            pkt_L = self.keep(pkt_L)
+            if not pkt_L:
+                return self.get_batch(max_pkts, max_bytes)  # all dropped, try the packets behind
+        if pkt_L and metrics.collector is not None:
+            self.count_get(pkt_L)
+        return pkt_L
+    
+    # put as many of the packets as there is room for, holding the queue lock only once
+    # @param pkt_L - list of packets to be inserted into the queue
+    # @return the number of packets inserted or dropped by the drop policy, packets beyond it did not fit
+    def put_batch(self, pkt_L):
+        if self.drop_policy is not None:
+            return self.put_each(pkt_L)
+        q = self.queue
+        with q.mutex:
+            count = len(pkt_L)
+            if q.maxsize > 0:
+                count = min(count, q.maxsize - q._qsize())
+            for pkt in pkt_L[:count]:
+                q._put(pkt)
+            if count:
+                q.unfinished_tasks += count
+                q.not_empty.notify(count)
+        if metrics.collector is not None:
+            self.count_put(pkt_L[:count], len(pkt_L) - count)
+        if count:
+            for callback in self.listener_L:
+                callback()
+        return count
+
+
+# interface for networks run on an asyncio event loop (see Runnable.arun),
+# backed by an asyncio.Queue instead of a thread-safe queue
+class AsyncInterface(Interface):
+    # @param max_queue_size - the maximum size of the queue storing packets
+    def __init__(self, max_queue_size=0):
+        Interface.__init__(self, max_queue_size)
+        self.queue = asyncio.Queue(max_queue_size)
+    
+    # get packet from the queue interface
+    def get(self):
+        while True:
+            try:
+                pkt = self.queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return None
+            if self.drop_policy is None or self.keep((pkt,)):
+                break
+        if metrics.collector is not None:
+            self.count_get((pkt,))
+        return pkt
+    
+    # schedulers are queue.Queue subclasses, which cannot be awaited
+    def set_scheduler(self, scheduler):
+        raise ValueError('%s does not support scheduling disciplines' % type(self).__name__)
+    
+    # wait for a packet and get it from the queue interface
+    async def aget(self):
+        while True:
+            pkt = await self.queue.get()
+            if self.drop_policy is None or self.keep((pkt,)):
+                break
+        if metrics.collector is not None:
+            self.count_get((pkt,))
+        return pkt
     
     # put the packet into the interface queue
     # @param pkt - Packet to be inserted into the queue
-    # @param block - if True, block until room in queue, if False may throw queue.Full exception
+    # @param block - ignored, blocking would stall the event loop; throws queue.Full if there is no room,
+    #  aqm.PolicyDrop if the drop policy drops the packet
+    def put(self, pkt, block=False):
+        if self.drop_policy is not None and not self.admit((pkt,)):
+            raise aqm.PolicyDrop
+        try:
+            self.queue.put_nowait(pkt)
+        except asyncio.QueueFull:
+            if self.drop_policy is not None:
+                self.unadmit((pkt,))
+            if metrics.collector is not None:
+                self.count_put((), 1)
+            raise queue.Full
+        if metrics.collector is not None:
+            self.count_put((pkt,))
+        for callback in self.listener_L:
+            callback()
+    
+    # wait for room and put the packet into the interface queue
+    # @param pkt - Packet to be inserted into the queue
+    # @return False if the drop policy dropped the packet
+    async def aput(self, pkt):
+        if self.drop_policy is not None and not self.admit((pkt,)):
+            return False
+        await self.queue.put(pkt)
+        if metrics.collector is not None:
+            self.count_put((pkt,))
+        for callback in self.listener_L:
+            callback()
+        return True
+    
+    # get up to max_pkts packets, see Interface.get_batch
+    def get_batch(self, max_pkts, max_bytes=None):
+        pkt_L = []
+        byte_count = 0
+        while not self.queue.empty() and len(pkt_L) < max_pkts:
+            pkt = self.queue.get_nowait()
+            pkt_L.append(pkt)
+            byte_count += len(pkt)
+            if max_bytes is not None and byte_count >= max_bytes:
+                break
+        if pkt_L and self.drop_policy is not None:
+            pkt_L = self.keep(pkt_L)
+            if not pkt_L:
+                return self.get_batch(max_pkts, max_bytes)  # all dropped, try the packets behind
+        if pkt_L and metrics.collector is not None:
+            self.count_get(pkt_L)
+        return pkt_L
+    
+    # put as many of the packets as there is room for, see Interface.put_batch
+    def put_batch(self, pkt_L):
+        if self.drop_policy is not None:
+            return self.put_each(pkt_L)
+        count = 0
+        for pkt in pkt_L:
+            if self.queue.full():
+                break
+            self.queue.put_nowait(pkt)
+            count += 1
+        if metrics.collector is not None:
+            self.count_put(pkt_L[:count], len(pkt_L) - count)
+        if count:
+            for callback in self.listener_L:
+                callback()
+        return count
+
+
+# interface backed by a preallocated fixed-slot ring buffer (see shm_ring.RingBuffer)
+# instead of a queue of Python objects; the ring can live in shared memory to be
+# used by two processes. Packets are dropped (queue.Full) when the ring is full.
+# The ring takes no locks, so each interface must have a single producer and a
+# single consumer, as interfaces linked by one Link do.
+class RingInterface(Interface):
+    default_capacity = 1024
+    
+    # @param max_queue_size - number of ring slots, 0 for the default capacity
+    # @param shared - True to allocate the ring in multiprocessing shared memory
+    def __init__(self, max_queue_size=0, shared=False):
+        self.capacity = max_queue_size or RingInterface.default_capacity
+        self.shared = shared
+        self.ring = None
+        Interface.__init__(self, max_queue_size)
+        self.queue = None
+    
+    # the slots are sized from the MTU, so the ring is (re)allocated when the MTU is configured
+    @property
+    def mtu(self):
+        return self._mtu
+    
+    @mtu.setter
+    def mtu(self, mtu):
+        self._mtu = mtu
+        Interface.mtu_version += 1
+        if self.ring is not None:
+            self.ring.unlink()
+        # slots leave room for text packets of mtu characters encoded as UTF-8
+        self.ring = RingBuffer(self.capacity, 4 * mtu, self.shared)
+    
+    # detach from the shared memory of the ring, in a process that uses but does not own the interface
+    def close(self):
+        if self.ring is not None:
+            self.ring.close()
+    
+    # free the shared memory of the ring, called by the owner of the interface once done with it
+    def unlink(self):
+        if self.ring is not None:
+            self.ring.unlink()
+            self.ring = None
+    
+    # number of packets in the ring
+    def qsize(self):
+        return len(self.ring)
+    
+    # the ring is first in first out
+    def set_scheduler(self, scheduler):
+        raise ValueError('%s does not support scheduling disciplines' % type(self).__name__)
+    
+    # the ring may be shared by two processes, which cannot share the state of a drop policy
+    def set_drop_policy(self, policy):
+        raise ValueError('%s does not support drop policies' % type(self).__name__)
+    
+    # get packet from the ring
+    def get(self):
+        pkt = self.ring.get()
+        if pkt is not None and metrics.collector is not None:
+            self.count_get((pkt,))
+        return pkt
+    
+    # put the packet into the ring
+    # @param pkt - Packet to be inserted into the ring
+    # @param block - ignored; throws queue.Full if the ring is full
     def put(self, pkt, block=False):
-        self.queue.put(pkt, block)
+        if not self.ring.put(pkt):
+            if metrics.collector is not None:
+                self.count_put((), 1)
+            raise queue.Full
+        if metrics.collector is not None:
+            self.count_put((pkt,))
+        for callback in self.listener_L:
+            callback()
+    
+    # get up to max_pkts packets, see Interface.get_batch
+    def get_batch(self, max_pkts, max_bytes=None):
+        pkt_L = []
+        byte_count = 0
+        while len(pkt_L) < max_pkts:
+            pkt = self.ring.get()
+            if pkt is None:
+                break
+            pkt_L.append(pkt)
+            byte_count += len(pkt)
+            if max_bytes is not None and byte_count >= max_bytes:
+                break
+        if pkt_L and metrics.collector is not None:
+            self.count_get(pkt_L)
+        return pkt_L
+    
+    # put as many of the packets as there is room for, see Interface.put_batch
+    def put_batch(self, pkt_L):
+        count = 0
+        for pkt in pkt_L:
+            if not self.ring.put(pkt):
+                break
+            count += 1
+        if metrics.collector is not None:
+            self.count_put(pkt_L[:count], len(pkt_L) - count)
+        if count:
+            for callback in self.listener_L:
+                callback()
+        return count
 
 
 # Implements a network layer packet (different from the RDT packet
@@ -32,167 +465,514 @@ class Interface:
 # NOTE: This class will need to be extended to for the packet to include
 # the fields necessary for the completion of this assignment.
 class NetworkPacket:
-    # packet encoding lengths
+    # wire formats: fixed-width binary header, or the original zero-filled decimal text header
+    BINARY = 'binary'
+    TEXT = 'text'
+    wire_format = BINARY
+    # text packet encoding lengths
     dst_addr_S_length = 5
     id_S_length = 2
     flag_S_length = 1
+    tclass_S_length = 1
     offset_S_length = 2
-    header_S_length = dst_addr_S_length + id_S_length + flag_S_length + offset_S_length
+    src_addr_S_length = 5
+    header_S_length = (dst_addr_S_length + id_S_length + flag_S_length + tclass_S_length + offset_S_length
+                       + src_addr_S_length)
+    text_field_L = [('id', id_S_length), ('flag', flag_S_length), ('tclass', tclass_S_length),
+                    ('offset', offset_S_length), ('dst_addr', dst_addr_S_length), ('src_addr', src_addr_S_length)]
+    # binary packet encoding: id, flag, tclass, offset, dst_addr and src_addr in network byte order
+    header_struct = struct.Struct('!IBBIII')
+    id_struct = struct.Struct('!I')
+    flag_struct = struct.Struct('!B')
+    tclass_struct = struct.Struct('!B')
+    offset_struct = struct.Struct('!I')
+    dst_addr_struct = struct.Struct('!I')
+    src_addr_struct = struct.Struct('!I')
+    id_pos = 0
+    flag_pos = id_pos + id_struct.size
+    tclass_pos = flag_pos + flag_struct.size
+    offset_pos = tclass_pos + tclass_struct.size
+    dst_addr_pos = offset_pos + offset_struct.size
+    src_addr_pos = dst_addr_pos + dst_addr_struct.size
     id = 0
     flag = 0
+    tclass = 0
     offset = 0
+    src_addr = 0
     
     #@param dst_addr: address of the destination host
-    # @param data_S: packet payload
-    def __init__(self, dst_addr, data_S, id=1, flag=0, offset=0):
+    # @param data_S: packet payload, str for the text format and bytes (or memoryview) for the binary one
+    # @param src_addr: address of the source host, identifies the datagram together with id
+    # @param tclass: traffic class, 0 to 9, used by priority scheduling (see qdisc.py)
+    def __init__(self, dst_addr, data_S, id=1, flag=0, offset=0, src_addr=0, tclass=0):
         self.dst_addr = dst_addr
         self.data_S = data_S
         self.id = id
         self.flag = flag
         self.offset = offset
+        self.src_addr = src_addr
+        self.tclass = tclass
     
     # called when printing the object
     def __str__(self):
-        return self.to_byte_S()
+        return self.header_text() + NetworkPacket.decode_data(self.data_S)
     
     def __len__(self):
-        return len(self.to_byte_S)
+        return len(self.to_byte_S())
     
-    # convert packet to a byte string for transmission over links
-    def to_byte_S(self):
+    # length of the packet header in the current wire format
+    @classmethod
+    def header_length(cls):
+        if cls.wire_format == NetworkPacket.BINARY:
+            return cls.header_struct.size
+        return cls.header_S_length
+    
+    # convert an application message into a payload of the current wire format
+    # @param data_S: message as passed to Host.udt_send
+    @classmethod
+    def encode_data(cls, data_S):
+        if cls.wire_format == NetworkPacket.BINARY and isinstance(data_S, str):
+            return data_S.encode()
+        return data_S
+    
+    # convert a (reassembled) payload back into a printable message
+    # @param data_S: str, bytes or memoryview payload
+    @staticmethod
+    def decode_data(data_S):
+        if isinstance(data_S, str):
+            return data_S
+        return bytes(data_S).decode(errors='replace')
+    
+    # the header rendered in the text format, without its field width limits, for printing
+    def header_text(self):
         byte_S = ''
         byte_S += str(self.id).zfill(self.id_S_length)
         byte_S += str(self.flag).zfill(self.flag_S_length)
+        byte_S += str(self.tclass).zfill(self.tclass_S_length)
         byte_S += str(self.offset).zfill(self.offset_S_length)
         byte_S += str(self.dst_addr).zfill(self.dst_addr_S_length)
-        byte_S += self.data_S
+        byte_S += str(self.src_addr).zfill(self.src_addr_S_length)
         return byte_S
     
+    # convert packet to a byte string for transmission over links
+    # raises ValueError if a field is wider than its digits in the text format
+    def to_byte_S(self):
+        if NetworkPacket.wire_format == NetworkPacket.BINARY:
+            return self.header_struct.pack(self.id, self.flag, self.tclass, self.offset, self.dst_addr,
+                                           self.src_addr) + self.data_S
+        header_S = self.header_text()
+        if len(header_S) != NetworkPacket.header_S_length:
+            for name, width in NetworkPacket.text_field_L:
+                if len(str(getattr(self, name))) > width:
+                    raise ValueError('%s %s does not fit the %d digits of the text header'
+                                     % (name, getattr(self, name), width))
+        return header_S + self.data_S
+    
+    # read only the destination address of an encoded packet, for forwarding decisions
+    # @param byte_S: byte string representation of the packet
+    @classmethod
+    def peek_dst_addr(cls, byte_S):
+        if not isinstance(byte_S, str):
+            return cls.dst_addr_struct.unpack_from(byte_S, cls.dst_addr_pos)[0]
+        m = cls.id_S_length + cls.flag_S_length + cls.tclass_S_length + cls.offset_S_length
+        return int(byte_S[m : m + cls.dst_addr_S_length])
+    
+    # a printable form of an encoded packet, for log messages, without parsing it
+    # @param byte_S: byte string representation of the packet
+    @staticmethod
+    def printable(byte_S):
+        if isinstance(byte_S, str):
+            return byte_S
+        return NetworkPacketView(byte_S)
+    
+    # read only the source address of an encoded packet, for per-flow scheduling
+    # @param byte_S: byte string representation of the packet
+    @classmethod
+    def peek_src_addr(cls, byte_S):
+        if not isinstance(byte_S, str):
+            return cls.src_addr_struct.unpack_from(byte_S, cls.src_addr_pos)[0]
+        m = cls.header_S_length - cls.src_addr_S_length
+        return int(byte_S[m : cls.header_S_length])
+    
+    # read only the traffic class of an encoded packet, for priority scheduling
+    # @param byte_S: byte string representation of the packet
+    @classmethod
+    def peek_tclass(cls, byte_S):
+        if not isinstance(byte_S, str):
+            return cls.tclass_struct.unpack_from(byte_S, cls.tclass_pos)[0]
+        m = cls.id_S_length + cls.flag_S_length
+        return int(byte_S[m : m + cls.tclass_S_length])
+    
     # extract a packet object from a byte string
+    # str byte strings are parsed as the text format, bytes as the binary format
     # @param byte_S: byte string representation of the packet
     @classmethod
     def from_byte_S(self, byte_S):
+        if not isinstance(byte_S, str):
+            return NetworkPacketView(byte_S)
         m = NetworkPacket.id_S_length
         id = int(byte_S[:m])
         flag = int(byte_S[m : m + NetworkPacket.flag_S_length])
         m += NetworkPacket.flag_S_length
+        tclass = int(byte_S[m : m + NetworkPacket.tclass_S_length])
+        m += NetworkPacket.tclass_S_length
         offset = int(byte_S[m : m + NetworkPacket.offset_S_length])
         m += NetworkPacket.offset_S_length
         dst_addr = int(byte_S[m : m + NetworkPacket.dst_addr_S_length])
         m += NetworkPacket.dst_addr_S_length
+        src_addr = int(byte_S[m : m + NetworkPacket.src_addr_S_length])
+        m += NetworkPacket.src_addr_S_length
         data_S = byte_S[m:]
-        return self(dst_addr, data_S, id, flag, offset)
+        return self(dst_addr, data_S, id, flag, offset, src_addr, tclass)
+
+
+# A binary packet parsed in place: header fields are unpacked from the
+# byte string only when read and the payload is a memoryview into it,
+# so routers never copy the payload of packets they forward unchanged.
+class NetworkPacketView(NetworkPacket):
+    
+    # @param byte_S: binary byte string representation of the packet
+    def __init__(self, byte_S):
+        self.byte_S = byte_S
+        self.buf = memoryview(byte_S)
+    
+    @property
+    def id(self):
+        return self.id_struct.unpack_from(self.buf, self.id_pos)[0]
+    
+    @property
+    def flag(self):
+        return self.flag_struct.unpack_from(self.buf, self.flag_pos)[0]
+    
+    @property
+    def tclass(self):
+        return self.tclass_struct.unpack_from(self.buf, self.tclass_pos)[0]
+    
+    @property
+    def offset(self):
+        return self.offset_struct.unpack_from(self.buf, self.offset_pos)[0]
+    
+    @property
+    def dst_addr(self):
+        return self.dst_addr_struct.unpack_from(self.buf, self.dst_addr_pos)[0]
+    
+    @property
+    def src_addr(self):
+        return self.src_addr_struct.unpack_from(self.buf, self.src_addr_pos)[0]
+    
+    @property
+    def data_S(self):
+        return self.buf[self.header_struct.size:]
+    
+    # the packet is already encoded, return the original byte string
+    def to_byte_S(self):
+        return self.byte_S
 
 
 # Implements a network host for receiving and transmitting data
-class Host:
+class Host(Runnable):
     
     #@param addr: address of this node represented as an integer
-    def __init__(self, addr):
+    # @param reassembly_timeout: seconds to wait for the missing fragments of a datagram
+    # @param reassembly_max_bytes: payload bytes buffered for incomplete datagrams before the oldest are dropped
+    # @param intf_class: Interface, or AsyncInterface for running on an asyncio event loop
+    # @param pmtu_expiry: seconds a path MTU learned from router reports is used
+    def __init__(self, addr, reassembly_timeout=30.0, reassembly_max_bytes=1 << 20, intf_class=Interface,
+                 pmtu_expiry=600.0):
+        Runnable.__init__(self)
         self.addr = addr
-        self.in_intf_L = [Interface()]
-        self.out_intf_L = [Interface()]
-        self.stop = False  # for thread termination
-        self.fragments = list()
+        self.in_intf_L = [intf_class()]
+        self.out_intf_L = [intf_class()]
+        self.in_intf_L[0].name = '%s in 0' % self
+        self.out_intf_L[0].name = '%s out 0' % self
+        self.in_intf_L[0].add_listener(self.notify)  # wake up when a packet arrives
+        self.reassembler = Reassembler(reassembly_timeout, reassembly_max_bytes)
+        self.pmtu_cache = PathMtuCache(pmtu_expiry)  # smallest MTU on the path to each destination
+        self.receiver_L = []  # callbacks invoked with every datagram received
     
     # called when printing the object
     def __str__(self):
         return 'Host_%s' % (self.addr)
     
+    # register a callback to be invoked with every datagram received
+    # @param callback - function taking the source address, the datagram id and the reassembled payload
+    def add_receiver(self, callback):
+        self.receiver_L.append(callback)
+    
     # create a packet and enqueue for transmission
     # @param dst_addr: destination address for the packet
     # @param data_S: data being transmitted to the network layer
-    def udt_send(self, dst_addr, data_S, id, mtu=None, offset=0):
-        if mtu is None: mtu = self.out_intf_L[0].mtu
-        msg_length = offset + mtu - NetworkPacket.header_S_length
-        if NetworkPacket.header_S_length + len(data_S) > mtu:
-            flag = int(NetworkPacket.header_S_length + len(data_S) > mtu * 2)
-            p = NetworkPacket(dst_addr, data_S[offset:msg_length], id, flag, offset)
-            print('%s: sending packet "%s" on the out interface with mtu=%d' % (self, p, mtu))
-            self.out_intf_L[0].put(p.to_byte_S())
-            self.udt_send(dst_addr, data_S[offset:], id, mtu, msg_length - offset)
-        else:
-            p = NetworkPacket(dst_addr, data_S[offset:msg_length], id, 0, offset)
-            print('%s: sending packet "%s" on the out interface with mtu=%d' % (self, p, mtu))
-            self.out_intf_L[0].put(p.to_byte_S())
+    # @param mtu: fragment size, by default the out interface MTU or the smaller path MTU if known
+    # @param tclass: traffic class of the packets, 0 to 9
+    def udt_send(self, dst_addr, data_S, id, mtu=None, tclass=0):
+        if mtu is None:
+            mtu = self.out_intf_L[0].mtu
+            path_mtu = self.pmtu_cache.get(dst_addr)
+            if path_mtu is not None and path_mtu < mtu:
+                mtu = path_mtu
+        data_S = NetworkPacket.encode_data(data_S)
+        frag_count = 0
+        # encode every fragment first, so that a field too wide for the text header sends none of them
+        p_L = [NetworkPacket(dst_addr, frag_S, id, flag, offset, self.addr, tclass)
+               for offset, flag, frag_S in fragment(data_S, mtu, NetworkPacket.header_length())]
+        pkt_L = [p.to_byte_S() for p in p_L]
+        for p, pkt_S in zip(p_L, pkt_L):
+            log(INFO, '%s: sending packet "%s" on the out interface with mtu=%d', self, p, mtu)
+            self.out_intf_L[0].put(pkt_S)  # send packets always enqueued successfully
+            frag_count += 1
+            if packet_trace.writer is not None:
+                packet_trace.writer.record(self, 0, packet_trace.TX, pkt_S)
+            if metrics.collector is not None:
+                metrics.collector.pkt_out(self, pkt_S)
+        if frag_count > 1 and metrics.collector is not None:
+            metrics.collector.fragments(self, frag_count)
     
     # receive packet from the network layer
+    # @return True if a packet was received
     def udt_receive(self):
         pkt_S = self.in_intf_L[0].get()
-        if pkt_S is not None:
-            p = NetworkPacket.from_byte_S(pkt_S)
-            self.fragments.append(p)
-            message_data = ''
-            if p.flag == 0:
-                for frag in self.fragments:
-                    if frag.id == p.id:  message_data += frag.data_S
-                print('%s: received packet "%s" on the in interface' % (self, message_data))
-    
-    # thread target for the host to keep receiving data
-    def run(self):
-        print(threading.currentThread().getName() + ': Starting')
-        while True:
-            # receive data arriving to the in interface
-            self.udt_receive()
-            # terminate
-            if (self.stop):
-                print(threading.currentThread().getName() + ': Ending')
-                return
+        if pkt_S is None:
+            return False
+        if packet_trace.writer is not None:
+            packet_trace.writer.record(self, 0, packet_trace.RX, pkt_S)
+        if metrics.collector is not None:
+            metrics.collector.pkt_in(self, pkt_S)
+        p = NetworkPacket.from_byte_S(pkt_S)
+        data_S = self.reassembler.add(p.src_addr, p.id, p.offset, p.flag, p.data_S)
+        if data_S is not None:
+            if rlog.level >= INFO:
+                log(INFO, '%s: received packet "%s" on the in interface', self, NetworkPacket.decode_data(data_S))
+            for callback in self.receiver_L:
+                callback(p.src_addr, p.id, data_S)
+        return True
+    
+    # receive all data queued on the in interface and discard timed out datagrams, called by the thread target
+    def poll(self):
+        pkt_count = 0
+        while self.udt_receive():
+            pkt_count += 1
+        if self.reassembler:
+            self.reassembler.expire()
+        return pkt_count
+    
+    # seconds until the oldest incomplete datagram times out, so that the host wakes up to discard it
+    # @return None to sleep until notified if no datagram is waiting for fragments
+    def timeout(self):
+        expiry = self.reassembler.next_expiry()
+        if expiry is None:
+            return None
+        return max(0.0, expiry - self.reassembler.clock())
+    
+    # free the interfaces, e.g. the shared memory of RingInterfaces, once the host has stopped
+    def close(self):
+        for intf in self.in_intf_L + self.out_intf_L:
+            intf.unlink()
 
 
 # Implements a multi-interface router described in class
-class Router:
+class Router(Runnable):
     routing_table = None
+    pmtu_feedback = None  # called with (source, destination, MTU) for packets refragmented, see path_mtu.py
     #@param name: friendly router name for debugging
     # @param intf_count: the number of input and output interfaces
     # @param max_queue_size: max queue length (passed to Interface)
-    def __init__(self, name, intf_count, max_queue_size, routing_table):
-        self.stop = False  # for thread termination
+    # @param routing_table: RoutingTable, or a {destination address: interface number} dictionary
+    # @param intf_class: Interface, or AsyncInterface for running on an asyncio event loop
+    # @param scheduler: scheduling discipline of the outgoing interfaces (see qdisc.make), None for FIFO
+    # @param drop_policy: drop policy of the outgoing interfaces (see aqm.make), None to drop only when full
+    # @param intf_budget: packets forwarded from each incoming interface per sweep, so that busy interfaces
+    #  cannot starve the others
+    # @param flow_cache_size: destinations whose outgoing interface and MTU are remembered, see flow_cache.py
+    def __init__(self, name, intf_count, max_queue_size, routing_table, intf_class=Interface, scheduler=None,
+                 drop_policy=None, intf_budget=8, flow_cache_size=1024):
+        Runnable.__init__(self)
         self.name = name
         # create a list of interfaces
-        self.in_intf_L = [Interface(max_queue_size) for _ in range(intf_count)]
-        self.out_intf_L = [Interface(max_queue_size) for _ in range(intf_count)]
+        self.in_intf_L = [intf_class(max_queue_size) for _ in range(intf_count)]
+        self.out_intf_L = [intf_class(max_queue_size) for _ in range(intf_count)]
+        for i in range(intf_count):
+            self.in_intf_L[i].name = '%s in %d' % (self, i)
+            self.out_intf_L[i].name = '%s out %d' % (self, i)
+        self.intf_budget = intf_budget
+        self.ready_S = set(range(intf_count))  # incoming interfaces that may have packets
+        self.start_intf = 0  # incoming interface served first in the next sweep
+        for i, intf in enumerate(self.in_intf_L):
+            intf.add_listener(lambda i=i: self.intf_ready(i))  # wake up when a packet arrives
+        if scheduler is not None:
+            for intf in self.out_intf_L:
+                intf.set_scheduler(scheduler)
+        if drop_policy is not None:
+            for intf in self.out_intf_L:
+                intf.set_drop_policy(drop_policy())
+        if not isinstance(routing_table, RoutingTable):
+            routing_table = RoutingTable(routing_table)
         self.routing_table = routing_table
+        self.flow_cache = FlowCache(flow_cache_size)
     
     # called when printing the object
     def __str__(self):
         return 'Router_%s' % (self.name)
     
     # look through the content of incoming interfaces and forward to
-    # appropriate outgoing interfaces
+    # appropriate outgoing interfaces: every interface packets arrived on
+    # since it was last drained gets to forward up to intf_budget packets,
+    # starting one interface further round each sweep
+    # @return the number of packets taken off the incoming interfaces
     def forward(self):
-        for i in range(len(self.in_intf_L)):
-            pkt_S = None
+        # routes changed during a sweep apply from the next one
+        self.flow_cache.validate((self.routing_table.version, Interface.mtu_version))
+        pkt_count = 0
+        intf_count = len(self.in_intf_L)
+        start = self.start_intf
+        self.start_intf = (start + 1) % intf_count
+        ready_L = list(self.ready_S)
+        ready_L.sort(key=lambda i: (i - start) % intf_count)
+        for i in ready_L:
+            # forget the interface before draining it, so that a packet arriving meanwhile marks it again
+            self.ready_S.discard(i)
+            intf = self.in_intf_L[i]
+            pkt_L = intf.get_batch(self.intf_budget)
+            if intf.qsize():
+                self.ready_S.add(i)  # over budget, continue in the next sweep
+            pkt_count += len(pkt_L)
+            for pkt_S in pkt_L:
+                self.forward_packet(pkt_S, i)
+        return pkt_count
+    
+    # mark an incoming interface as having packets and wake up, called when a packet arrives on it
+    # @param i: interface number
+    def intf_ready(self, i):
+        self.ready_S.add(i)
+        self.notify()
+    
+    # forward a packet taken off an incoming interface
+    # @param pkt_S: the packet
+    # @param i: incoming interface number
+    def forward_packet(self, pkt_S, i):
+        if packet_trace.writer is not None:
+            packet_trace.writer.record(self, i, packet_trace.RX, pkt_S)
+        m = metrics.collector
+        if m is not None:
+            m.pkt_in(self, pkt_S)
+            start = time.perf_counter()
+        # look up the outgoing interface from the destination address alone
+        try:
+            if len(pkt_S) < NetworkPacket.header_length():
+                raise ValueError('shorter than a %d byte header' % NetworkPacket.header_length())
+            dst_addr = NetworkPacket.peek_dst_addr(pkt_S)
+        except (ValueError, struct.error) as e:
+            log(ERROR, '%s: malformed packet %r on interface %d, dropping: %s', self, pkt_S, i, e)
+            self.count_drop(pkt_S, i, metrics.DROP_MALFORMED)
+            return
+        route = self.flow_cache.get(dst_addr)
+        if route is None:
+            route = self.route(dst_addr)
+        dst, mtu = route
+        if dst is None:
+            if rlog.level >= ERROR:
+                log(ERROR, '%s: no route for packet "%s" on interface %d, dropping',
+                    self, NetworkPacket.printable(pkt_S), i)
+            self.count_drop(pkt_S, i, metrics.DROP_NO_ROUTE)
+            return
+        if len(pkt_S) > mtu:
+            if mtu <= NetworkPacket.header_length():
+                log(ERROR, '%s: packet %r on interface %d routed to interface %d, too small for a header, dropping',
+                    self, pkt_S, i, dst)
+                self.count_drop(pkt_S, i, metrics.DROP_MTU)
+                return
             try:
-                # get packet from interface i
-                pkt_S = self.in_intf_L[i].get()
-                if pkt_S is not None:
-                    p = NetworkPacket.from_byte_S(pkt_S)  # parse a packet out
-                    self.handle_frag(p, i, self.routing_table.get(p.dst_addr), self.out_intf_L[i].mtu)
-            except queue.Full:
-                print('%s: packet "%s" lost on interface %d' % (self, p, i))
-                pass
-    
-    def handle_frag(self, packet, src, dst, mtu, offset=0):
-        if NetworkPacket.header_S_length + len(packet.data_S) > mtu:
-            p = NetworkPacket(packet.dst_addr, packet.data_S[offset:offset + mtu - NetworkPacket.header_S_length], packet.id, 1, offset=offset)
-            print('%s: forwarding packet "%s" from interface %d to %d with mtu %d' % (self, p, src, dst, mtu))
-            self.out_intf_L[dst].put(p.to_byte_S())
-        else:
-            print('%s: forwarding packet "%s" from interface %d to %d with mtu %d' % (self, packet, src, dst, mtu))
-            self.out_intf_L[dst].put(packet.to_byte_S())
+                p = NetworkPacket.from_byte_S(pkt_S)  # parse a packet out to fragment it
+            except ValueError as e:
+                log(ERROR, '%s: malformed packet %r on interface %d, dropping: %s', self, pkt_S, i, e)
+                self.count_drop(pkt_S, i, metrics.DROP_MALFORMED)
+                return
+        try:
+            if len(pkt_S) <= mtu:
+                # fast path: the packet fits, forward the original byte string
+                if rlog.level >= DEBUG:
+                    log(DEBUG, '%s: forwarding packet "%s" from interface %d to %d with mtu %d',
+                        self, NetworkPacket.printable(pkt_S), i, dst, mtu)
+                self.out_intf_L[dst].put(pkt_S)
+                if packet_trace.writer is not None:
+                    packet_trace.writer.record(self, dst, packet_trace.TX, pkt_S)
+                if m is not None:
+                    m.pkt_out(self, pkt_S)
+            else:
+                if self.pmtu_feedback is not None:
+                    self.pmtu_feedback(p.src_addr, p.dst_addr, mtu)
+                self.handle_frag(p, i, dst, mtu)
+            if m is not None:
+                m.latency(self, time.perf_counter() - start)
+        except aqm.PolicyDrop:
+            if rlog.level >= DEBUG:
+                log(DEBUG, '%s: packet "%s" dropped by the drop policy of interface %d',
+                    self, NetworkPacket.printable(pkt_S), i)
+        except queue.Full:
+            if rlog.level >= ERROR:
+                log(ERROR, '%s: packet "%s" lost on interface %d', self, NetworkPacket.printable(pkt_S), i)
+            self.count_drop(pkt_S, i, metrics.DROP_FULL)
+    
+    # trace and count a packet the router drops
+    # @param pkt_S: the packet
+    # @param i: incoming interface number
+    # @param reason: metrics.DROP_* reason
+    def count_drop(self, pkt_S, i, reason):
+        if packet_trace.writer is not None:
+            packet_trace.writer.record(self, i, packet_trace.DROP, pkt_S)
+        if metrics.collector is not None:
+            metrics.collector.drop(self, reason)
+    
+    # look up the outgoing interface of a destination and remember it in the flow cache
+    # @param dst_addr: destination address
+    # @return (outgoing interface number, its MTU), (None, None) if there is no route
+    def route(self, dst_addr):
+        dst = self.routing_table.get(dst_addr)
+        route = (dst, None if dst is None else self.out_intf_L[dst].mtu)
+        self.flow_cache.put(dst_addr, route)
+        return route
+    
+    # forward a packet, fragmenting it if it does not fit the outgoing interface
+    # @param packet: NetworkPacket to forward
+    # @param src: incoming interface number
+    # @param dst: outgoing interface number
+    # @param mtu: MTU of the outgoing interface
+    def handle_frag(self, packet, src, dst, mtu):
+        if NetworkPacket.header_length() + len(packet.data_S) <= mtu:
+            log(DEBUG, '%s: forwarding packet "%s" from interface %d to %d with mtu %d', self, packet, src, dst, mtu)
+            pkt_S = packet.to_byte_S()
+            self.out_intf_L[dst].put(pkt_S)
+            if packet_trace.writer is not None:
+                packet_trace.writer.record(self, dst, packet_trace.TX, pkt_S)
+            if metrics.collector is not None:
+                metrics.collector.pkt_out(self, pkt_S)
+            return
+        p_L = [NetworkPacket(packet.dst_addr, frag_S, packet.id, flag, offset, packet.src_addr, packet.tclass)
+               for offset, flag, frag_S in fragment(packet.data_S, mtu, NetworkPacket.header_length(), packet.offset,
+                                                    packet.flag)]
+        try:
+            pkt_L = [p.to_byte_S() for p in p_L]
+        except ValueError as e:
+            # a fragment offset too wide for the text header, drop the packet before sending any fragment
+            log(ERROR, '%s: cannot fragment packet "%s" from interface %d to mtu %d, dropping: %s',
+                self, packet, src, mtu, e)
+            self.count_drop(packet.to_byte_S(), src, metrics.DROP_MTU)
             return
-        offset = offset + mtu - NetworkPacket.header_S_length - offset
-        packet.data_S = packet.data_S[offset:]
-        self.handle_frag(packet, src, dst, mtu, offset)
+        for p, pkt_S in zip(p_L, pkt_L):
+            log(DEBUG, '%s: forwarding packet "%s" from interface %d to %d with mtu %d', self, p, src, dst, mtu)
+            self.out_intf_L[dst].put(pkt_S)
+            if packet_trace.writer is not None:
+                packet_trace.writer.record(self, dst, packet_trace.TX, pkt_S)
+            if metrics.collector is not None:
+                metrics.collector.pkt_out(self, pkt_S)
+                metrics.collector.fragments(self, 1)
     
-    # thread target for the host to keep forwarding data
-    def run(self):
-        print(threading.currentThread().getName() + ': Starting')
-        while True:
-            self.forward()
-            if self.stop:
-                print(threading.currentThread().getName() + ': Ending')
-                return
+    # forward everything queued on the incoming interfaces, called by the thread target
+    def poll(self):
+        return self.forward()
+    
+    # free the interfaces, e.g. the shared memory of RingInterfaces, once the router has stopped
+    def close(self):
+        for intf in self.in_intf_L + self.out_intf_L:
+            intf.unlink()
 
 # EOF
\ No newline at end of file
@@ -0,0 +1,214 @@
+# packet_trace.py
+'''
+Opt-in capture of every packet event to an append-only binary trace file, and
+an offline reader for it.
+
+Capture is started with start(path); the hot paths then call writer.record for
+each packet a node sends, receives, forwards or drops and each packet a link
+delivers. Records are packed into a memory buffer and written to the file in
+large blocks. The reader memory-maps the file and only copies out the records
+that pass its filters.
+
+Usage: python packet_trace.py trace_file [--node NAME] [--direction rx|tx|drop|link]
+'''
+
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+from collections import namedtuple
+
+# packet event directions
+RX = 0  # a node took the packet off one of its interfaces
+TX = 1  # a node put the packet on one of its interfaces
+DROP = 2  # the packet was lost or dropped
+LINK = 3  # a link delivered the packet to the interface at its far end
+direction_name_L = ['rx', 'tx', 'drop', 'link']
+
+# file header: magic and version
+file_header = b'PKTTRACE\x00\x01'
+# record header: timestamp, interface number, direction, packet type (0 bytes, 1 str),
+# node name length and packet length, followed by the node name and the packet
+record_struct = struct.Struct('<dHBBBI')
+
+# an event read back from a trace
+TraceRecord = namedtuple('TraceRecord', 'time node intf direction data')
+
+writer = None  # the active TraceWriter, None when not capturing
+
+
+# Buffers packet events and appends them to a trace file in large writes.
+class TraceWriter:
+
+    # @param path: trace file, created or truncated
+    # @param buffer_size: bytes buffered before a write to the file
+    # @param clock: function returning the timestamp of an event
+    def __init__(self, path, buffer_size=1 << 20, clock=time.time):
+        self.path = path
+        self.buffer_size = buffer_size
+        self.clock = clock
+        self.file = open(path, 'wb')
+        self.file.write(file_header)
+        self.buf = bytearray()
+        self.lock = threading.Lock()  # records come from every node thread
+        self.name_D = {}  # node name -> encoded node name
+        self.record_count = 0
+
+    # record a packet event
+    # @param node: name of the host, router or link (anything with a str form)
+    # @param intf: interface number on the node
+    # @param direction: RX, TX, DROP or LINK
+    # @param pkt_S: the packet as it travels the links, str or bytes-like
+    def record(self, node, intf, direction, pkt_S):
+        name = str(node)
+        name_B = self.name_D.get(name)
+        if name_B is None:
+            name_B = self.name_D[name] = name.encode()[:255]
+        if isinstance(pkt_S, str):
+            pkt_type = 1
+            pkt_S = pkt_S.encode()
+        else:
+            pkt_type = 0
+        header = record_struct.pack(self.clock(), intf, direction, pkt_type, len(name_B), len(pkt_S))
+        with self.lock:
+            self.buf += header
+            self.buf += name_B
+            self.buf += pkt_S
+            self.record_count += 1
+            if len(self.buf) >= self.buffer_size:
+                self.write_buffer()
+
+    # append the buffered records to the file, the caller holds the lock
+    def write_buffer(self):
+        self.file.write(self.buf)
+        del self.buf[:]
+
+    # write the buffered records
+    def flush(self):
+        with self.lock:
+            self.write_buffer()
+            self.file.flush()
+
+    # write the buffered records and close the file
+    def close(self):
+        self.flush()
+        self.file.close()
+
+    # forked processes trace to their own file, '<path>.<pid>'
+    def reopen_in_child(self):
+        self.lock = threading.Lock()
+        del self.buf[:]
+        self.path = '%s.%d' % (self.path, os.getpid())
+        self.file = open(self.path, 'wb')
+        self.file.write(file_header)
+        self.record_count = 0
+
+
+# start capturing packet events
+# @param path: trace file
+# @param clock: function returning the timestamp of an event, e.g. Simulator.clock for virtual time
+def start(path, clock=time.time):
+    global writer
+    stop()
+    writer = TraceWriter(path, clock=clock)
+
+
+# stop capturing and close the trace file
+def stop():
+    global writer
+    if writer is not None:
+        writer.close()
+        writer = None
+
+
+def _before_fork():
+    if writer is not None:
+        writer.flush()
+
+
+def _after_fork_in_child():
+    if writer is not None:
+        writer.reopen_in_child()
+
+
+os.register_at_fork(before=_before_fork, after_in_child=_after_fork_in_child)
+
+
+# Reads a trace file through a memory map.
+class TraceReader:
+
+    # @param path: trace file written by TraceWriter
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+        size = os.fstat(self.file.fileno()).st_size
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if size else b''
+        if self.map[:len(file_header)] != file_header:
+            raise ValueError('%s is not a packet trace' % path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if isinstance(self.map, mmap.mmap):
+            self.map.close()
+        self.file.close()
+
+    # iterate over the recorded events, oldest first
+    # @param node: only events of the node with this name
+    # @param direction: only events in this direction (RX, TX, DROP or LINK)
+    # @param intf: only events on this interface number
+    # @param since: only events at or after this time
+    # @param until: only events before this time
+    # @return generator of TraceRecord
+    def events(self, node=None, direction=None, intf=None, since=None, until=None):
+        node_B = node.encode() if node is not None else None
+        data = self.map
+        pos = len(file_header)
+        end = len(data)
+        unpack_from = record_struct.unpack_from
+        header_size = record_struct.size
+        while pos + header_size <= end:
+            timestamp, pkt_intf, pkt_direction, pkt_type, name_len, pkt_len = unpack_from(data, pos)
+            name_pos = pos + header_size
+            pkt_pos = name_pos + name_len
+            pos = pkt_pos + pkt_len
+            if direction is not None and pkt_direction != direction:
+                continue
+            if intf is not None and pkt_intf != intf:
+                continue
+            if since is not None and timestamp < since:
+                continue
+            if until is not None and timestamp >= until:
+                continue
+            name_B = data[name_pos:pkt_pos]
+            if node_B is not None and name_B != node_B:
+                continue
+            pkt_S = data[pkt_pos:pos]
+            if pkt_type == 1:
+                pkt_S = pkt_S.decode()
+            yield TraceRecord(timestamp, name_B.decode(), pkt_intf, pkt_direction, pkt_S)
+
+    def __iter__(self):
+        return self.events()
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print(__doc__.strip().splitlines()[-1])
+        sys.exit(1)
+    arg_L = sys.argv[2:]
+    filter_D = {}
+    if '--node' in arg_L:
+        filter_D['node'] = arg_L[arg_L.index('--node') + 1]
+    if '--direction' in arg_L:
+        filter_D['direction'] = direction_name_L.index(arg_L[arg_L.index('--direction') + 1])
+    with TraceReader(sys.argv[1]) as reader:
+        for r in reader.events(**filter_D):
+            print('%.6f %s %d %s %r' % (r.time, r.node, r.intf, direction_name_L[r.direction], r.data))
+
+# EOF
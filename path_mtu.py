@@ -0,0 +1,91 @@
+# path_mtu.py
+
+import time
+
+
+# Path MTUs learned by a host, per destination address.
+# An entry holds the smallest MTU reported on the path to a destination and
+# expires after a while, so that the host tries its interface MTU again in
+# case the path changed to larger links.
+class PathMtuCache:
+
+    # @param expiry: seconds an entry is used after the last report lowering or confirming it
+    # @param clock: function returning the current time in seconds
+    def __init__(self, expiry=600.0, clock=time.monotonic):
+        self.expiry = expiry
+        self.clock = clock
+        self.mtu_D = {}  # destination address -> (path MTU, time of the report)
+
+    # @param dst_addr: destination address
+    # @return the path MTU to the destination, None if unknown or expired
+    def get(self, dst_addr):
+        entry = self.mtu_D.get(dst_addr)
+        if entry is None:
+            return None
+        mtu, reported = entry
+        if self.clock() - reported >= self.expiry:
+            # routers update the cache from their threads: remove only the expired entry,
+            # not one reported meanwhile, and do not fail if it was removed already
+            current = self.mtu_D.pop(dst_addr, None)
+            if current is not None and current is not entry:
+                self.mtu_D.setdefault(dst_addr, current)
+            return None
+        return mtu
+
+    # record a report of a link on the path to a destination
+    # @param dst_addr: destination address
+    # @param mtu: MTU of the link the packets did not fit
+    def update(self, dst_addr, mtu):
+        cached = self.get(dst_addr)
+        if cached is None or mtu <= cached:
+            self.mtu_D[dst_addr] = (mtu, self.clock())
+
+    # forget the path MTU to a destination, or to all destinations if dst_addr is None
+    def clear(self, dst_addr=None):
+        if dst_addr is None:
+            self.mtu_D.clear()
+        else:
+            self.mtu_D.pop(dst_addr, None)
+
+    def __len__(self):
+        return len(self.mtu_D)
+
+
+# Carries "packet too big" reports from routers to the source hosts.
+# Routers report the MTU of the link they had to refragment a packet for; the
+# report goes straight to the cache of the packet's source host, as the
+# routers have no routes back to the sources. Hosts in other processes (see
+# sharding.py) do not get the reports of routers in this one.
+class PathMtuFeedback:
+
+    # @param host_L: hosts that may send packets
+    def __init__(self, host_L):
+        self.host_D = {host.addr: host for host in host_L}
+        self.report_count = 0
+
+    # called when printing the object
+    def __str__(self):
+        return 'PathMtuFeedback'
+
+    # report a packet that did not fit a link, called by Router
+    # @param src_addr: source address of the packet
+    # @param dst_addr: destination address of the packet
+    # @param mtu: MTU of the link
+    def __call__(self, src_addr, dst_addr, mtu):
+        host = self.host_D.get(src_addr)
+        if host is not None:
+            self.report_count += 1
+            host.pmtu_cache.update(dst_addr, mtu)
+
+
+# turn path MTU discovery on for a network
+# @param host_L: hosts of the network
+# @param router_L: routers of the network
+# @return the PathMtuFeedback connecting them
+def enable(host_L, router_L):
+    feedback = PathMtuFeedback(host_L)
+    for router in router_L:
+        router.pmtu_feedback = feedback
+    return feedback
+
+# EOF
@@ -0,0 +1,188 @@
+# qdisc.py
+'''
+Scheduling disciplines for router output interfaces.
+
+Each discipline is a queue.Queue that only overrides the storage methods
+(_init, _qsize, _put, _get), so the locking, maxsize and the batch operations
+of Interface work unchanged. Packets are classified by peeking at their
+header, without parsing them:
+
+    PriorityQueue  strict priority by the traffic class field, highest first
+    DrrQueue       deficit round robin over flows, O(1) per packet
+    WfqQueue       weighted fair queueing over flows (self-clocked), O(log n)
+                   per packet
+
+A flow is a (source address, destination address) pair.
+Router(scheduler=...) and Interface.set_scheduler take a factory built by
+make(), e.g. make('drr', quantum=1500).
+'''
+
+import heapq
+import queue
+from collections import deque
+from network_3 import NetworkPacket
+
+
+# flow of an encoded packet
+def flow_of(pkt_S):
+    return NetworkPacket.peek_src_addr(pkt_S), NetworkPacket.peek_dst_addr(pkt_S)
+
+
+# weight of a flow, which must be positive: a flow of weight 0 would never earn the right to send
+# @param weight: function of a flow returning its weight, None for equal weights
+def weight_of(weight, flow):
+    w = weight(flow) if weight is not None else 1
+    if not w > 0:
+        raise ValueError('weight %r of flow %s is not positive' % (w, flow))
+    return w
+
+
+# Strict priority: a packet is only sent when no packet of a higher traffic class is queued.
+# Packets of the same class are sent in arrival order.
+class PriorityQueue(queue.Queue):
+    class_count = 10  # traffic classes 0 to 9, as the text header has room for one digit
+
+    def _init(self, maxsize):
+        self.band_L = [deque() for _ in range(self.class_count)]
+        self.count = 0
+
+    def _qsize(self):
+        return self.count
+
+    def _put(self, pkt_S):
+        tclass = NetworkPacket.peek_tclass(pkt_S)
+        self.band_L[min(tclass, self.class_count - 1)].append(pkt_S)
+        self.count += 1
+
+    def _get(self):
+        for band in reversed(self.band_L):
+            if band:
+                self.count -= 1
+                return band.popleft()
+        raise IndexError('get from an empty PriorityQueue')
+
+
+# Deficit round robin: backlogged flows take turns, each sending up to its
+# quantum of bytes (times its weight) per turn; bytes a flow could not use
+# because its next packet was larger are carried over to its next turn.
+class DrrQueue(queue.Queue):
+
+    # @param maxsize: maximum number of packets, 0 for unlimited
+    # @param quantum: bytes a flow of weight 1 may send per turn, at least the MTU keeps it O(1)
+    # @param weight: function of a flow returning its (positive) weight, None for equal weights
+    def __init__(self, maxsize=0, quantum=1500, weight=None):
+        if not quantum > 0:
+            raise ValueError('quantum %r is not positive' % (quantum,))
+        self.quantum = quantum
+        self.weight = weight
+        queue.Queue.__init__(self, maxsize)
+
+    def _init(self, maxsize):
+        self.flow_D = {}  # flow -> deque of its packets, only for backlogged flows
+        self.deficit_D = {}  # flow -> bytes it may still send in its turn
+        self.turn_D = {}  # flow -> bytes it may send per turn, its quantum times its weight
+        self.active_Q = deque()  # backlogged flows, the one whose turn it is first
+        self.count = 0
+
+    def _qsize(self):
+        return self.count
+
+    def _put(self, pkt_S):
+        flow = flow_of(pkt_S)
+        pkt_Q = self.flow_D.get(flow)
+        if pkt_Q is None:
+            turn = self.quantum * weight_of(self.weight, flow)
+            pkt_Q = self.flow_D[flow] = deque()
+            self.turn_D[flow] = turn
+            self.deficit_D[flow] = 0
+            self.active_Q.append(flow)
+            if len(self.active_Q) == 1:
+                self.next_turn()
+        pkt_Q.append(pkt_S)
+        self.count += 1
+
+    def _get(self):
+        while True:
+            flow = self.active_Q[0]
+            pkt_Q = self.flow_D[flow]
+            if len(pkt_Q[0]) <= self.deficit_D[flow]:
+                pkt_S = pkt_Q.popleft()
+                self.count -= 1
+                if pkt_Q:
+                    self.deficit_D[flow] -= len(pkt_S)
+                else:
+                    # an idle flow keeps no credit
+                    self.active_Q.popleft()
+                    del self.flow_D[flow]
+                    del self.deficit_D[flow]
+                    del self.turn_D[flow]
+                    self.next_turn()
+                return pkt_S
+            # the flow's turn is over
+            self.active_Q.rotate(-1)
+            self.next_turn()
+
+    # give the flow whose turn it is its quantum
+    def next_turn(self):
+        if self.active_Q:
+            flow = self.active_Q[0]
+            self.deficit_D[flow] += self.turn_D[flow]
+
+
+# Self-clocked weighted fair queueing: each packet is stamped with the
+# virtual time at which it would finish under fluid fair sharing,
+# max(virtual time, finish of the flow's previous packet) + length / weight,
+# and packets are sent in stamp order; the virtual time is the stamp of the
+# packet last sent.
+class WfqQueue(queue.Queue):
+
+    # @param maxsize: maximum number of packets, 0 for unlimited
+    # @param weight: function of a flow returning its (positive) weight, None for equal weights
+    def __init__(self, maxsize=0, weight=None):
+        self.weight = weight
+        queue.Queue.__init__(self, maxsize)
+
+    def _init(self, maxsize):
+        self.heap = []  # (finish stamp, arrival number, flow, packet)
+        self.finish_D = {}  # flow -> finish stamp of its last queued packet
+        self.queued_D = {}  # flow -> number of its packets queued
+        self.virtual_time = 0.0
+        self.arrival_count = 0
+
+    def _qsize(self):
+        return len(self.heap)
+
+    def _put(self, pkt_S):
+        flow = flow_of(pkt_S)
+        weight = weight_of(self.weight, flow)
+        finish = max(self.virtual_time, self.finish_D.get(flow, 0.0)) + len(pkt_S) / weight
+        self.finish_D[flow] = finish
+        self.queued_D[flow] = self.queued_D.get(flow, 0) + 1
+        self.arrival_count += 1
+        heapq.heappush(self.heap, (finish, self.arrival_count, flow, pkt_S))
+
+    def _get(self):
+        finish, _, flow, pkt_S = heapq.heappop(self.heap)
+        self.virtual_time = finish
+        self.queued_D[flow] -= 1
+        if not self.queued_D[flow]:
+            # forget idle flows, their next packet starts from the virtual time
+            del self.queued_D[flow]
+            del self.finish_D[flow]
+        return pkt_S
+
+
+scheduler_D = {'fifo': queue.Queue, 'priority': PriorityQueue, 'drr': DrrQueue, 'wfq': WfqQueue}
+
+
+# a factory of queues of a discipline
+# @param name: 'fifo', 'priority', 'drr' or 'wfq'
+# @param params: parameters of the discipline, e.g. quantum for drr, weight for drr and wfq
+# @return function taking the maximum queue size and returning a new queue
+def make(name, **params):
+    if name not in scheduler_D:
+        raise ValueError('unknown scheduler %r, not one of %s' % (name, ', '.join(scheduler_D)))
+    queue_class = scheduler_D[name]
+    return lambda maxsize: queue_class(maxsize, **params)
+
+# EOF
@@ -0,0 +1,169 @@
+# reassembly.py
+
+import time
+from collections import OrderedDict
+
+
+# A datagram being put back together from its fragments.
+# The byte ranges received are tracked, so that duplicate and overlapping
+# fragments are counted once. Binary payloads are kept as chunks until the
+# last fragment gives the length, then copied by offset into one buffer of
+# that length; text payloads (str) are kept as chunks indexed by offset.
+class Datagram:
+
+    # @param is_text: True if the fragments carry str payloads
+    # @param created: time the first fragment arrived
+    def __init__(self, is_text, created):
+        self.is_text = is_text
+        self.created = created
+        self.chunk_D = {}  # offset -> payload, of the fragments not copied into buf
+        self.buf = None  # binary payload, allocated once the total is known
+        self.range_L = []  # sorted, disjoint (start, end) byte ranges received so far
+        self.received = 0  # payload length received so far, overlaps counted once
+        self.total = None  # payload length, known once the last fragment arrives
+
+    # store a fragment
+    # @param offset: position of the fragment payload in the datagram
+    # @param more: True if more fragments follow this one
+    # @param data_S: fragment payload
+    # @return the number of payload bytes added, 0 for a duplicate
+    def add(self, offset, more, data_S):
+        end = offset + len(data_S)
+        if not more and self.total is None:
+            self.total = end
+        added = self.cover(offset, end)
+        if added:
+            if self.buf is not None:
+                self.copy(offset, data_S)
+            elif len(data_S) > len(self.chunk_D.get(offset, '')):
+                self.chunk_D[offset] = data_S
+        if self.buf is None and not self.is_text and self.total is not None:
+            self.buf = bytearray(self.total)
+            for chunk_offset, chunk in self.chunk_D.items():
+                self.copy(chunk_offset, chunk)
+            self.chunk_D = {}
+        return added
+
+    # mark a byte range received
+    # @param start: first byte of the range
+    # @param end: byte after the range
+    # @return the number of bytes of the range not received before
+    def cover(self, start, end):
+        added = end - start
+        lo, hi = start, end
+        range_L = []
+        for r_start, r_end in self.range_L:
+            if r_end < start or r_start > end:
+                range_L.append((r_start, r_end))
+            else:  # overlapping or adjacent, merge
+                added -= max(0, min(r_end, end) - max(r_start, start))
+                lo, hi = min(lo, r_start), max(hi, r_end)
+        range_L.append((lo, hi))
+        range_L.sort()
+        self.range_L = range_L
+        self.received += added
+        return added
+
+    # copy a binary payload into the buffer, leaving out bytes past the total
+    def copy(self, offset, data_S):
+        if offset < self.total:
+            self.buf[offset:offset + len(data_S)] = data_S[:self.total - offset]
+
+    # True once every byte up to the last fragment has been received
+    def complete(self):
+        return self.total is not None and bool(self.range_L) and self.range_L[0][0] == 0 \
+            and self.range_L[0][1] >= self.total
+
+    # the reassembled payload
+    def data(self):
+        if not self.is_text:
+            return self.buf
+        # join the chunks in order, leaving out what overlaps the chunks before
+        part_L = []
+        pos = 0
+        for offset in sorted(self.chunk_D):
+            chunk = self.chunk_D[offset]
+            if offset + len(chunk) > pos:
+                part_L.append(chunk[pos - offset:])
+                pos = offset + len(chunk)
+        return ''.join(part_L)[:self.total]
+
+
+# Reassembles fragmented datagrams keyed by (source address, id).
+# State for a datagram is created by its first fragment and freed as soon as it
+# completes; incomplete datagrams are evicted oldest first once they exceed the
+# timeout or the buffered payload exceeds the memory budget. Timed out datagrams
+# are discarded when a new datagram starts and whenever the owner calls expire,
+# which next_expiry tells it when to do.
+class Reassembler:
+
+    # @param timeout: seconds after which an incomplete datagram is discarded
+    # @param max_bytes: maximum payload bytes buffered for incomplete datagrams
+    # @param clock: function returning the current time in seconds
+    def __init__(self, timeout=30.0, max_bytes=1 << 20, clock=time.monotonic):
+        self.timeout = timeout
+        self.max_bytes = max_bytes
+        self.clock = clock
+        self.datagram_D = OrderedDict()  # (src_addr, id) -> Datagram, oldest first
+        self.buffered = 0  # payload bytes held by incomplete datagrams
+        self.evicted = 0  # number of incomplete datagrams discarded
+
+    # add a received fragment
+    # @param src_addr: address of the source host
+    # @param id: datagram id
+    # @param offset: position of the fragment payload in the datagram
+    # @param more: True (non-zero flag) if more fragments follow this one
+    # @param data_S: fragment payload
+    # @return the reassembled payload if this fragment completes its datagram, otherwise None
+    def add(self, src_addr, id, offset, more, data_S):
+        key = (src_addr, id)
+        datagram = self.datagram_D.get(key)
+        if datagram is None:
+            if offset == 0 and not more:
+                return data_S  # not fragmented
+            now = self.clock()
+            self.expire(now)
+            datagram = Datagram(isinstance(data_S, str), now)
+            self.datagram_D[key] = datagram
+        self.buffered += datagram.add(offset, more, data_S)
+        if datagram.complete():
+            del self.datagram_D[key]
+            self.buffered -= datagram.received
+            return datagram.data()
+        self.evict()
+        return None
+
+    # discard incomplete datagrams older than the timeout
+    # @param now: current time, read from the clock if None
+    def expire(self, now=None):
+        if now is None:
+            now = self.clock()
+        while self.datagram_D:
+            key, datagram = next(iter(self.datagram_D.items()))
+            if now - datagram.created < self.timeout:
+                return
+            self.discard(key)
+
+    # @return the time at which the oldest incomplete datagram expires, None if none is waiting
+    def next_expiry(self):
+        if not self.datagram_D:
+            return None
+        return next(iter(self.datagram_D.values())).created + self.timeout
+
+    # discard the oldest incomplete datagrams while over the memory budget
+    def evict(self):
+        while self.buffered > self.max_bytes and self.datagram_D:
+            self.discard(next(iter(self.datagram_D)))
+
+    # drop the state of an incomplete datagram
+    # @param key: (src_addr, id) of the datagram
+    def discard(self, key):
+        datagram = self.datagram_D.pop(key)
+        self.buffered -= datagram.received
+        self.evicted += 1
+
+    # number of datagrams waiting for more fragments
+    def __len__(self):
+        return len(self.datagram_D)
+
+# EOF
@@ -0,0 +1,128 @@
+# rlog.py
+'''
+Buffered, leveled logging for the simulations, replacing rprint's lock around print.
+
+Logging a message only appends its format string and arguments to a deque, an
+atomic operation that takes no lock; messages above the verbosity level are
+not even recorded. A background writer thread formats the records and writes
+them in batches, so the format strings are only evaluated for messages that
+are actually written. Messages with arguments other than plain immutable
+values (numbers, strings, None) are formatted when logged instead, so that
+they show the state of their arguments at that time. Messages go to the
+sys.stdout of the time they are written, unless set_output chose a file.
+'''
+
+import atexit
+import os
+import sys
+import threading
+import time
+from collections import deque
+
+# verbosity levels
+OFF = 0  # log nothing
+ERROR = 1  # packets lost or dropped
+INFO = 2  # objects starting and ending, hosts sending and receiving
+DEBUG = 3  # every hop: routers forwarding and links transmitting
+
+level = DEBUG  # messages with a higher level are discarded
+flush_interval = 0.01  # seconds between batches written by the writer thread
+batch_size = 4096  # maximum number of records formatted per write
+
+_record_Q = deque()  # (format string, arguments) waiting to be written
+_stream = None  # where messages are written, None for sys.stdout
+_file = None  # the file set_output opened, closed when replaced and at exit
+_plain_type_S = {str, int, float, bool, bytes, type(None)}  # arguments formatted by the writer thread
+_writer = None  # the writer thread, started by the first message
+_write_lock = threading.Lock()  # serializes the writer thread and explicit flushes, never taken by log
+
+
+# record a message
+# @param msg_level: verbosity level of the message
+# @param fmt: %-format string, only evaluated if the message is written
+# @param args: arguments to the format string
+def log(msg_level, fmt, *args):
+    if msg_level > level:
+        return
+    for arg in args:
+        if type(arg) not in _plain_type_S:
+            fmt, args = fmt % args, ()  # the argument may change before the writer thread gets to it
+            break
+    _record_Q.append((fmt, args))
+    if _writer is None:
+        _start_writer()
+
+
+# @param new_level: one of OFF, ERROR, INFO, DEBUG
+def set_level(new_level):
+    global level
+    level = new_level
+
+
+# write messages to a stream or a file instead of standard output
+# @param output: file name, an object with write and flush methods, or None for standard output
+def set_output(output):
+    global _stream, _file
+    flush()
+    if _file is not None:
+        _file.close()
+        _file = None
+    if isinstance(output, str):
+        output = _file = open(output, 'a')
+    _stream = output
+
+
+# the stream messages are written to now
+def _output():
+    return _stream if _stream is not None else sys.stdout
+
+
+# write every recorded message now
+def flush():
+    with _write_lock:
+        while _record_Q:
+            _write_batch()
+        _output().flush()
+
+
+# format and write up to batch_size records, the caller holds _write_lock
+def _write_batch():
+    line_L = []
+    while _record_Q and len(line_L) < batch_size:
+        fmt, args = _record_Q.popleft()
+        line_L.append(fmt % args if args else fmt)
+    if line_L:
+        line_L.append('')
+        _output().write('\n'.join(line_L))
+
+
+def _start_writer():
+    global _writer
+    with _write_lock:
+        if _writer is None:
+            _writer = threading.Thread(name='rlog', target=_run_writer, daemon=True)
+            _writer.start()
+
+
+# thread target for the writer: write whatever was recorded every flush_interval
+def _run_writer():
+    while True:
+        time.sleep(flush_interval)
+        if _record_Q:
+            with _write_lock:
+                while _record_Q:
+                    _write_batch()
+                _output().flush()
+
+
+# forked processes start without the writer thread and without the parent's records,
+# which the parent flushes before forking
+def _after_fork_in_child():
+    global _writer, _write_lock
+    _writer = None
+    _write_lock = threading.Lock()
+    _record_Q.clear()
+
+
+os.register_at_fork(before=flush, after_in_child=_after_fork_in_child)
+atexit.register(set_output, None)  # write every recorded message and close the file opened
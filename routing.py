@@ -0,0 +1,221 @@
+# routing.py
+
+
+# Computes shortest-path (fewest hops) routes to every host from the links of a
+# link layer and installs them as host routes in the routers' RoutingTables.
+# Routes are computed with one breadth-first search per destination, walking
+# the links backwards from it. Destinations share searches: the hosts reached
+# through a single link from the same router are routed like that router,
+# so a router with many hosts behind it costs one search. When a link is added
+# or removed, only the searches that used or can use the link are redone, and
+# only the routes that changed are written to the routing tables.
+class ShortestPathRouting:
+
+    # @param link_L: links of the network, e.g. LinkLayer.link_L
+    def __init__(self, link_L):
+        self.link_L = list(link_L)
+        self.pred_D = {}  # node -> [(router linked to it, interface number on the router)]
+        self.in_link_D = {}  # host -> links delivering to it
+        self.group_D = {}  # search target -> hosts routed by the search
+        self.target_D = {}  # host -> search target
+        self.tree_D = {}  # search target -> ({router: hops}, {router: interface number})
+        self.route_D = {}  # router -> {host address: interface number}, as installed
+        for link in self.link_L:
+            self.add_edge(link)
+        for host in list(self.in_link_D):
+            self.regroup(host)
+        for target in self.group_D:
+            self.search(target)
+
+    # called when printing the object
+    def __str__(self):
+        return 'ShortestPathRouting'
+
+    @staticmethod
+    def is_router(node):
+        return hasattr(node, 'routing_table')
+
+    def add_edge(self, link):
+        if self.is_router(link.from_node):
+            self.pred_D.setdefault(link.to_node, []).append((link.from_node, link.from_intf_num))
+        for node in (link.from_node, link.to_node):
+            if not self.is_router(node):
+                self.in_link_D.setdefault(node, [])
+        if not self.is_router(link.to_node):
+            self.in_link_D[link.to_node].append(link)
+
+    def remove_edge(self, link):
+        if self.is_router(link.from_node):
+            self.pred_D[link.to_node].remove((link.from_node, link.from_intf_num))
+        if not self.is_router(link.to_node):
+            self.in_link_D[link.to_node].remove(link)
+
+    # the search routing a host: its router if a single link from a router reaches it, otherwise the host itself
+    def search_target(self, host):
+        in_link_L = self.in_link_D.get(host, [])
+        if len(in_link_L) == 1 and self.is_router(in_link_L[0].from_node):
+            return in_link_L[0].from_node
+        return host
+
+    # move a host to the group of its search target
+    # @return the search target, if it is new and has to be searched
+    def regroup(self, host):
+        target = self.search_target(host)
+        old = self.target_D.get(host)
+        if old is target:
+            return None
+        if old is not None:
+            self.group_D[old].remove(host)
+            if not self.group_D[old]:
+                del self.group_D[old]
+                del self.tree_D[old]
+        self.target_D[host] = target
+        if target in self.group_D:
+            self.group_D[target].append(host)
+            return None
+        self.group_D[target] = [host]
+        return target
+
+    # breadth-first search from a target along the links backwards, one hop count at a time
+    # @return ({router: hops to the target}, {router: interface number towards the target})
+    def search(self, target):
+        pred_D = self.pred_D
+        hops_D = {target: 0}
+        next_D = {}
+        node_L = [target]
+        hops = 0
+        while node_L:
+            hops += 1
+            next_node_L = []
+            for node in node_L:
+                for pred, intf in pred_D.get(node, ()):
+                    if pred not in hops_D:
+                        hops_D[pred] = hops
+                        next_D[pred] = intf
+                        next_node_L.append(pred)
+            node_L = next_node_L
+        self.tree_D[target] = (hops_D, next_D)
+        return self.tree_D[target]
+
+    # add the routes to the hosts of a search target's group
+    # @param route_D: {router: {host address: interface number}} to add to
+    # @param addr_S: only the routes to these addresses, None for all
+    def group_routes(self, target, route_D, addr_S=None):
+        hops_D, next_D = self.tree_D[target]
+        host_L = [host for host in self.group_D[target] if addr_S is None or host.addr in addr_S]
+        if not host_L:
+            return
+        for router, intf in next_D.items():
+            router_D = route_D.setdefault(router, {})
+            for host in host_L:
+                router_D[host.addr] = intf
+        if self.is_router(target):
+            router_D = route_D.setdefault(target, {})
+            for host in host_L:
+                router_D[host.addr] = self.in_link_D[host][0].from_intf_num
+
+    # all routes
+    # @return {router: {host address: interface number}}
+    def routes(self):
+        route_D = {}
+        for target in self.group_D:
+            self.group_routes(target, route_D)
+        return route_D
+
+    # write all routes to the routing tables
+    def install(self):
+        self.update(self.routes(), self.route_D)
+
+    # write changed routes to the routing tables
+    # @param new_D: current {router: {host address: interface number}} of the hosts concerned
+    # @param old_D: routes installed for the same hosts
+    def update(self, new_D, old_D):
+        for router in set(new_D) | set(old_D):
+            new_route_D = new_D.get(router, {})
+            old_route_D = old_D.get(router, {})
+            installed_D = self.route_D.setdefault(router, {})
+            removed_L = [addr for addr in old_route_D if addr not in new_route_D]
+            if removed_L:
+                router.routing_table.remove_hosts(removed_L)
+                for addr in removed_L:
+                    del installed_D[addr]
+            changed_D = {addr: intf for addr, intf in new_route_D.items() if old_route_D.get(addr) != intf}
+            if changed_D:
+                router.routing_table.add_hosts(changed_D)
+                installed_D.update(changed_D)
+
+    # the installed routes to a set of hosts
+    # @return {router: {host address: interface number}}
+    def installed_routes(self, addr_S):
+        route_D = {}
+        for router, installed_D in self.route_D.items():
+            router_D = {addr: installed_D[addr] for addr in addr_S if addr in installed_D}
+            if router_D:
+                route_D[router] = router_D
+        return route_D
+
+    # recompute the searches of some targets and install the routes that changed
+    # @param target_S: search targets to redo
+    # @param host_S: hosts whose grouping changed, their routes are rewritten too
+    def recompute(self, target_S, host_S=()):
+        for target in target_S:
+            if target in self.group_D:
+                self.search(target)
+        addr_S = {host.addr for target in target_S if target in self.group_D for host in self.group_D[target]}
+        addr_S.update(host.addr for host in host_S)
+        new_D = {}
+        for target in {self.target_D[host] for host in host_S} | set(target_S):
+            if target in self.group_D:
+                self.group_routes(target, new_D, addr_S)
+        self.update(new_D, self.installed_routes(addr_S))
+
+    # regroup the hosts at the ends of a link
+    # @return (search targets that are new, hosts regrouped)
+    def regroup_link(self, link):
+        target_S = set()
+        host_S = set()
+        for node in (link.from_node, link.to_node):
+            if not self.is_router(node):
+                old = self.target_D.get(node)
+                target = self.regroup(node)
+                if target is not None:
+                    target_S.add(target)
+                if self.target_D[node] is not old:
+                    host_S.add(node)
+        return target_S, host_S
+
+    # add a link and update the routes it shortens
+    # @param link: Link, already added to the link layer
+    def add_link(self, link):
+        self.link_L.append(link)
+        self.add_edge(link)
+        target_S, host_S = self.regroup_link(link)
+        u, v = link.from_node, link.to_node
+        if self.is_router(u):
+            for target, (hops_D, next_D) in self.tree_D.items():
+                if v in hops_D and hops_D[v] + 1 < hops_D.get(u, len(hops_D) + 1):
+                    target_S.add(target)
+        self.recompute(target_S, host_S)
+
+    # remove a link and update the routes that went over it
+    # @param link: Link, removed from the link layer
+    def remove_link(self, link):
+        self.link_L.remove(link)
+        self.remove_edge(link)
+        target_S, host_S = self.regroup_link(link)
+        u = link.from_node
+        for target, (hops_D, next_D) in self.tree_D.items():
+            if next_D.get(u) == link.from_intf_num:
+                target_S.add(target)
+        self.recompute(target_S, host_S)
+
+
+# compute shortest-path routes for a network and install them in its routers
+# @param link_L: links of the network, e.g. LinkLayer.link_L
+# @return ShortestPathRouting, to update the routes when links are added or removed
+def install_shortest_paths(link_L):
+    routing = ShortestPathRouting(link_L)
+    routing.install()
+    return routing
+
+# EOF
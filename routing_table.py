@@ -0,0 +1,136 @@
+# routing_table.py
+
+import bisect
+
+
+# Longest-prefix-match routing table over integer host addresses.
+# Routes are exact addresses, prefixes (address/length over addr_bits bit
+# addresses), inclusive address ranges, and an optional default route.
+# The routes are compiled into sorted, non-overlapping intervals, each resolved
+# to its most specific route, so that a lookup is a single binary search.
+class RoutingTable:
+
+    # @param routes: optional {address: interface number} dictionary of host routes
+    # @param default: interface number for addresses no route matches, None to drop them
+    # @param addr_bits: address width used to expand prefixes
+    def __init__(self, routes=None, default=None, addr_bits=32):
+        self.addr_bits = addr_bits
+        self.default = default
+        self.route_D = {}  # (lo, hi) -> interface number, in insertion order
+        self.version = 0  # incremented whenever the routes change
+        self.index = None  # compiled (interval starts, interface of each interval), None when out of date
+        if routes is not None:
+            for addr, intf in routes.items():
+                self.add_host(addr, intf)
+
+    # called when printing the object
+    def __str__(self):
+        route_L = ['%d-%d: %d' % (lo, hi, intf) if lo != hi else '%d: %d' % (lo, intf)
+                   for (lo, hi), intf in self.route_D.items()]
+        if self.default is not None:
+            route_L.append('default: %d' % self.default)
+        return '{%s}' % ', '.join(route_L)
+
+    # route a single address
+    # @param addr: host address
+    # @param intf: outgoing interface number
+    def add_host(self, addr, intf):
+        self.add_range(addr, addr, intf)
+
+    # route all addresses sharing the first length bits of prefix
+    # @param prefix: network address
+    # @param length: prefix length in bits
+    # @param intf: outgoing interface number
+    def add_prefix(self, prefix, length, intf):
+        if not 0 <= length <= self.addr_bits:
+            raise ValueError('prefix length %d out of range' % length)
+        size = 1 << (self.addr_bits - length)
+        lo = prefix & ~(size - 1)
+        self.add_range(lo, lo + size - 1, intf)
+
+    # route an inclusive range of addresses, replacing a route for the same range
+    # @param lo: first address of the range
+    # @param hi: last address of the range
+    # @param intf: outgoing interface number
+    def add_range(self, lo, hi, intf):
+        if lo > hi:
+            raise ValueError('empty address range %d-%d' % (lo, hi))
+        self.route_D[(lo, hi)] = intf
+        self.changed()
+
+    # route many single addresses at once, the table is recompiled only once
+    # @param route_D: {address: outgoing interface number}
+    def add_hosts(self, route_D):
+        for addr, intf in route_D.items():
+            self.route_D[(addr, addr)] = intf
+        self.changed()
+
+    # remove the routes of many single addresses at once
+    # @param addr_L: addresses routed with add_host or add_hosts
+    def remove_hosts(self, addr_L):
+        for addr in addr_L:
+            del self.route_D[(addr, addr)]
+        self.changed()
+
+    # remove the route for an address range (or a single address if hi is None)
+    def remove_range(self, lo, hi=None):
+        del self.route_D[(lo, lo if hi is None else hi)]
+        self.changed()
+
+    # @param intf: interface number for unmatched addresses, None to drop them
+    def set_default(self, intf):
+        self.default = intf
+        self.changed()
+
+    # mark the compiled lookup structure out of date
+    def changed(self):
+        self.version += 1
+        self.index = None
+
+    # build the sorted interval index: every interval between two route boundaries
+    # takes the interface of its narrowest covering route (the longest prefix)
+    # @return (interval starts, interface of each interval); it is published only if
+    #   the routes did not change, as another thread may update them meanwhile
+    def compile(self):
+        version = self.version
+        route_L = list(self.route_D.items())
+        default = self.default
+        point_L = sorted({p for (lo, hi), _ in route_L for p in (lo, hi + 1)})
+        owner_L = [default] * len(point_L)
+        # paint from the widest route to the narrowest, so more specific routes win;
+        # among equally wide routes the one added last wins
+        by_width = sorted(enumerate(route_L), key=lambda r: (r[1][0][0] - r[1][0][1], r[0]))
+        for _, ((lo, hi), intf) in by_width:
+            first = bisect.bisect_left(point_L, lo)
+            last = bisect.bisect_left(point_L, hi + 1)
+            owner_L[first:last] = [intf] * (last - first)
+        # merge neighbouring intervals routed the same way
+        start_L = [0]
+        intf_L = [default]
+        for point, intf in zip(point_L, owner_L):
+            if intf != intf_L[-1]:
+                if point == start_L[-1]:
+                    intf_L[-1] = intf
+                else:
+                    start_L.append(point)
+                    intf_L.append(intf)
+        index = (start_L, intf_L)
+        if self.version == version:
+            self.index = index
+        return index
+
+    # look up the outgoing interface for an address
+    # @param addr: destination address
+    # @param default: returned when no route (not even the default route) matches
+    def get(self, addr, default=None):
+        index = self.index  # read once, changed() may reset it meanwhile
+        if index is None:
+            index = self.compile()
+        start_L, intf_L = index
+        intf = intf_L[bisect.bisect_right(start_L, addr) - 1]
+        return default if intf is None else intf
+
+    def __len__(self):
+        return len(self.route_D)
+
+# EOF
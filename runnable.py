@@ -0,0 +1,86 @@
+# runnable.py
+
+import asyncio
+import threading
+from rlog import log, INFO
+
+
+# base class for network objects (hosts, routers, the link layer) driven by a thread
+# the thread sleeps until it is notified of new work or the object is stopped,
+# instead of spinning on empty interfaces
+class Runnable:
+
+    def __init__(self):
+        self.wakeup = threading.Event()  # set whenever there may be work to do
+        self._stop = False
+
+    # for thread termination
+    @property
+    def stop(self):
+        return self._stop
+
+    # setting stop also wakes the thread up, so that it can terminate
+    @stop.setter
+    def stop(self, value):
+        self._stop = value
+        self.notify()
+
+    # called by watched interfaces whenever a packet is enqueued
+    def notify(self):
+        self.wakeup.set()
+
+    # process the queued work
+    # @return the number of packets handled, 0 when idle
+    def poll(self):
+        raise NotImplementedError
+
+    # seconds until the object has to run again even if not notified
+    # @return None to sleep until notified
+    def timeout(self):
+        return None
+
+    # thread target for the object to keep processing data
+    def run(self):
+        log(INFO, '%s: Starting', threading.current_thread().name)
+        while True:
+            # sleep until notified, then drain everything that is queued
+            self.wakeup.wait(self.timeout())
+            self.wakeup.clear()
+            while self.poll():
+                pass
+            # terminate
+            if self.stop:
+                log(INFO, '%s: Ending', threading.current_thread().name)
+                return
+
+    # asyncio task equivalent of run, for running a whole network on one event loop
+    async def arun(self):
+        log(INFO, '%s: Starting', self)
+        # notifications now come from the event loop, start with a poll in case
+        # packets were queued before the task started
+        self.wakeup = asyncio.Event()
+        self.wakeup.set()
+        while True:
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), self.timeout())
+            except asyncio.TimeoutError:
+                pass
+            self.wakeup.clear()
+            while self.poll():
+                await asyncio.sleep(0)  # let the other objects run between batches
+            if self.stop:
+                log(INFO, '%s: Ending', self)
+                return
+
+
+# run objects as asyncio tasks for a while, then stop them
+# @param object_L: hosts, routers and link layers, created with asyncio interfaces
+# @param duration: seconds to run before stopping the objects
+async def run_async(object_L, duration):
+    task_L = [asyncio.create_task(o.arun()) for o in object_L]
+    await asyncio.sleep(duration)
+    for o in object_L:
+        o.stop = True
+    await asyncio.gather(*task_L)
+
+# EOF
@@ -0,0 +1,52 @@
+# scheduler.py
+
+import heapq
+import itertools
+import time
+
+
+# A heap of timed events, used to deliver packets when they finish crossing a
+# link instead of sleeping a thread per packet in flight.
+# Scheduling and popping an event are O(log n); events due at the same time
+# come out in the order they were scheduled.
+class Scheduler:
+
+    # @param clock: function returning the current time in seconds
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self.event_L = []  # heap of (time, sequence number, event)
+        self.seq = itertools.count()
+
+    # @param when: time at which the event is due
+    # @param event: object returned by pop_due once the event is due
+    def schedule(self, when, event):
+        heapq.heappush(self.event_L, (when, next(self.seq), event))
+
+    # time of the earliest event, None if no events are scheduled
+    def next_time(self):
+        if not self.event_L:
+            return None
+        return self.event_L[0][0]
+
+    # seconds until the earliest event is due, None if no events are scheduled
+    def timeout(self):
+        when = self.next_time()
+        if when is None:
+            return None
+        return max(0.0, when - self.clock())
+
+    # remove and return the events that are due
+    # @param now: current time, read from the clock if None
+    # @return list of events in due order
+    def pop_due(self, now=None):
+        if now is None:
+            now = self.clock()
+        event_L = []
+        while self.event_L and self.event_L[0][0] <= now:
+            event_L.append(heapq.heappop(self.event_L)[2])
+        return event_L
+
+    def __len__(self):
+        return len(self.event_L)
+
+# EOF
@@ -0,0 +1,212 @@
+# sharding.py
+
+import aqm
+import metrics
+import multiprocessing
+import packet_trace
+import queue
+import time
+from collections import deque
+import rlog
+from rlog import log, DEBUG, ERROR, INFO
+from shm_ring import RingBuffer
+
+
+# sending end of a link between two partitions: moves packets from the link's
+# 'from' interface into a shared memory ring
+class RingSender:
+
+    # @param link: Link whose 'to' node runs in another process
+    # @param ring: RingBuffer shared with the receiving process
+    def __init__(self, link, ring):
+        self.link = link
+        self.ring = ring
+
+    # @return the number of packets taken off the 'from' interface
+    def poll(self):
+        link = self.link
+        pkt_L = link.in_intf.get_batch(link.batch_pkts or 1, link.batch_bytes)
+        for pkt_S in pkt_L:
+            if metrics.collector is not None:
+                metrics.collector.pkt_in(link, pkt_S)
+            if len(pkt_S) > link.in_intf.mtu:
+                log(ERROR, '%s: packet "%s" length greater than the from interface MTU (%d)', link, pkt_S, link.in_intf.mtu)
+                reason = metrics.DROP_MTU
+            elif not self.ring.put(pkt_S):
+                log(ERROR, '%s: packet lost', link)
+                reason = metrics.DROP_FULL
+            else:
+                continue
+            if packet_trace.writer is not None:
+                packet_trace.writer.record(link, link.from_intf_num, packet_trace.DROP, pkt_S)
+            if metrics.collector is not None:
+                metrics.collector.drop(link, reason)
+        return len(pkt_L)
+
+
+# receiving end of a link between two partitions: moves packets from a shared
+# memory ring to the link's 'to' interface
+class RingReceiver:
+
+    # @param link: Link whose 'from' node runs in another process
+    # @param ring: RingBuffer shared with the sending process
+    # @param batch: maximum number of packets moved per poll
+    def __init__(self, link, ring, batch=64):
+        self.link = link
+        self.ring = ring
+        self.batch = batch
+
+    # @return the number of packets taken out of the ring
+    def poll(self):
+        pkt_count = 0
+        while pkt_count < self.batch:
+            pkt_S = self.ring.get()
+            if pkt_S is None:
+                break
+            pkt_count += 1
+            if len(pkt_S) > self.link.out_intf.mtu:
+                log(ERROR, '%s: packet "%s" length greater than the to interface MTU (%d)', self.link, pkt_S, self.link.out_intf.mtu)
+                if packet_trace.writer is not None:
+                    packet_trace.writer.record(self.link, self.link.to_intf_num, packet_trace.DROP, pkt_S)
+                if metrics.collector is not None:
+                    metrics.collector.drop(self.link, metrics.DROP_MTU)
+                continue
+            try:
+                self.link.out_intf.put(pkt_S)
+                log(DEBUG, '%s: transmitting packet "%s"', self.link, pkt_S)
+                if packet_trace.writer is not None:
+                    packet_trace.writer.record(self.link, self.link.to_intf_num, packet_trace.LINK, pkt_S)
+                if metrics.collector is not None:
+                    metrics.collector.pkt_out(self.link, pkt_S)
+            except aqm.PolicyDrop:
+                log(DEBUG, '%s: packet "%s" dropped by the drop policy of the to interface', self.link, pkt_S)
+            except queue.Full:
+                log(ERROR, '%s: packet lost', self.link)
+                if packet_trace.writer is not None:
+                    packet_trace.writer.record(self.link, self.link.to_intf_num, packet_trace.DROP, pkt_S)
+                if metrics.collector is not None:
+                    metrics.collector.drop(self.link, metrics.DROP_FULL)
+        return pkt_count
+
+
+# Runs a topology on several worker processes, one partition of the hosts and
+# routers per process, so that forwarding is not limited to one core by the GIL.
+# Links inside a partition are run by a local LinkLayer; links between
+# partitions carry packets over shared memory rings. Each worker polls its
+# objects in a loop and naps briefly when none of them had any work.
+# Workers are forked, so the nodes and links built by the parent are the ones
+# the workers run; calls registered with at_start run in the owning worker.
+class ShardedNetwork:
+
+    # @param object_L: hosts, routers and the LinkLayer holding all the links
+    # @param worker_count: number of worker processes
+    # @param partition: optional {node: worker number}, by default the nodes are split into
+    #  contiguous blocks of a breadth-first walk of the links, to keep neighbours together
+    # @param ring_capacity: number of packets each link between partitions can hold
+    # @param idle_sleep: seconds a worker naps when it had no work
+    def __init__(self, object_L, worker_count=2, partition=None, ring_capacity=1024, idle_sleep=0.0005):
+        self.link_layer = [o for o in object_L if hasattr(o, 'link_L')][0]
+        self.node_L = [o for o in object_L if not hasattr(o, 'link_L')]
+        self.worker_count = worker_count
+        self.ring_capacity = ring_capacity
+        self.idle_sleep = idle_sleep
+        self.partition = partition if partition is not None else self.partition_nodes()
+        self.start_L = []  # (function, args) to call in the owning worker at start
+        self.ctx = multiprocessing.get_context('fork')
+        self.stop_event = self.ctx.Event()
+        self.process_L = []
+        self.ring_D = {}  # link -> RingBuffer, for links between partitions
+
+    # called when printing the object
+    def __str__(self):
+        return 'ShardedNetwork'
+
+    # split the nodes into worker_count contiguous blocks of a breadth-first walk
+    # @return {node: worker number}
+    def partition_nodes(self):
+        neighbor_D = {id(n): [] for n in self.node_L}
+        for link in self.link_layer.link_L:
+            neighbor_D[id(link.from_node)].append(link.to_node)
+            neighbor_D[id(link.to_node)].append(link.from_node)
+        order_L = []
+        seen_S = set()
+        for start in self.node_L:
+            if id(start) in seen_S:
+                continue
+            seen_S.add(id(start))
+            node_Q = deque([start])
+            while node_Q:
+                node = node_Q.popleft()
+                order_L.append(node)
+                for neighbor in neighbor_D[id(node)]:
+                    if id(neighbor) not in seen_S:
+                        seen_S.add(id(neighbor))
+                        node_Q.append(neighbor)
+        block = -(-len(order_L) // self.worker_count)
+        return {node: i // block for i, node in enumerate(order_L)}
+
+    # call a function of a node, e.g. Host.udt_send, in the worker running the node once it starts
+    # @param fn: bound method of a host or router
+    # @param args: arguments to the function
+    def at_start(self, fn, *args):
+        self.start_L.append((fn, args))
+
+    # create the rings and fork the workers
+    def start(self):
+        for link in self.link_layer.link_L:
+            if self.partition[link.from_node] != self.partition[link.to_node]:
+                # slots leave room for text packets of mtu characters encoded as UTF-8
+                self.ring_D[link] = RingBuffer(self.ring_capacity, 4 * link.in_intf.mtu, shared=True)
+        for worker in range(self.worker_count):
+            p = self.ctx.Process(name='Worker_%d' % worker, target=self.run_worker, args=(worker,))
+            p.start()
+            self.process_L.append(p)
+
+    # stop the workers and free the rings
+    def stop(self):
+        self.stop_event.set()
+        for p in self.process_L:
+            p.join()
+        for ring in self.ring_D.values():
+            ring.unlink()
+
+    # run the network for a while
+    # @param duration: seconds to run before stopping the workers
+    def run(self, duration):
+        self.start()
+        time.sleep(duration)
+        self.stop()
+
+    # process target for a worker: poll the worker's objects until stopped
+    # @param worker: worker number
+    def run_worker(self, worker):
+        log(INFO, 'Worker_%d: Starting', worker)
+        # local links are run by a LinkLayer of their own, sharing the link settings of the original
+        local_layer = type(self.link_layer)(self.link_layer.batch_pkts, self.link_layer.batch_bytes,
+                                            self.link_layer.bandwidth, self.link_layer.delay)
+        poll_L = [n.poll for n in self.node_L if self.partition[n] == worker]
+        for link in self.link_layer.link_L:
+            from_worker = self.partition[link.from_node]
+            to_worker = self.partition[link.to_node]
+            if from_worker == worker and to_worker == worker:
+                local_layer.add_link(link)
+            elif from_worker == worker:
+                poll_L.append(RingSender(link, self.ring_D[link]).poll)
+            elif to_worker == worker:
+                poll_L.append(RingReceiver(link, self.ring_D[link]).poll)
+        poll_L.append(local_layer.poll)
+        for fn, args in self.start_L:
+            if self.partition[fn.__self__] == worker:
+                fn(*args)
+        while not self.stop_event.is_set():
+            pkt_count = 0
+            for poll in poll_L:
+                pkt_count += poll()
+            if not pkt_count:
+                timeout = local_layer.timeout()
+                self.stop_event.wait(self.idle_sleep if timeout is None else min(timeout, self.idle_sleep))
+        log(INFO, 'Worker_%d: Ending', worker)
+        rlog.flush()  # worker processes exit without running atexit handlers
+        packet_trace.stop()
+
+# EOF
@@ -0,0 +1,116 @@
+# shm_ring.py
+
+import struct
+from multiprocessing import shared_memory
+
+
+# Fixed-slot ring buffer of packets for one producer and one consumer.
+# All slots are allocated up front, in a bytearray or in a
+# multiprocessing.shared_memory block so that the producer and the consumer
+# can be different processes. The producer only ever writes the tail index and
+# the consumer the head index, so no lock is needed: a slot is written before
+# the tail moves past it and read before the head does.
+class RingBuffer:
+    # buffer layout: head, tail, capacity and slot size, then the slots
+    index_struct = struct.Struct('=Q')
+    info_struct = struct.Struct('=II')
+    head_pos = 0
+    tail_pos = head_pos + index_struct.size
+    info_pos = tail_pos + index_struct.size
+    slots_pos = info_pos + info_struct.size
+    # slot layout: packet type and length, then the packet
+    slot_struct = struct.Struct('=BI')
+    BYTES = 0
+    TEXT = 1
+
+    # @param capacity: number of slots
+    # @param slot_size: maximum packet length in bytes
+    # @param shared: True to allocate the ring in shared memory, False in a bytearray
+    # @param name: name of an existing shared memory ring to attach to, capacity and slot_size are then read from it
+    def __init__(self, capacity=1024, slot_size=1500, shared=False, name=None):
+        self.shm = None
+        if name is not None:
+            self.shm = shared_memory.SharedMemory(name=name)
+            self.buf = self.shm.buf
+            capacity, slot_size = self.info_struct.unpack_from(self.buf, self.info_pos)
+        else:
+            size = self.slots_pos + capacity * (self.slot_struct.size + slot_size)
+            if shared:
+                self.shm = shared_memory.SharedMemory(create=True, size=size)
+                self.buf = self.shm.buf
+            else:
+                self.buf = memoryview(bytearray(size))
+            self.index_struct.pack_into(self.buf, self.head_pos, 0)
+            self.index_struct.pack_into(self.buf, self.tail_pos, 0)
+            self.info_struct.pack_into(self.buf, self.info_pos, capacity, slot_size)
+        self.capacity = capacity
+        self.slot_size = slot_size
+        self.stride = self.slot_struct.size + slot_size
+
+    # name of the shared memory block, for attaching from another process
+    @property
+    def name(self):
+        return self.shm.name if self.shm is not None else None
+
+    def __len__(self):
+        return self.tail() - self.head()
+
+    def head(self):
+        return self.index_struct.unpack_from(self.buf, self.head_pos)[0]
+
+    def tail(self):
+        return self.index_struct.unpack_from(self.buf, self.tail_pos)[0]
+
+    def full(self):
+        return len(self) >= self.capacity
+
+    # copy a packet into the next free slot
+    # @param pkt_S: packet as str or bytes-like object
+    # @return False if the ring is full and the packet was not stored
+    def put(self, pkt_S):
+        tail = self.tail()
+        if tail - self.head() >= self.capacity:
+            return False
+        if isinstance(pkt_S, str):
+            pkt_type = self.TEXT
+            pkt_S = pkt_S.encode()
+        else:
+            pkt_type = self.BYTES
+        length = len(pkt_S)
+        if length > self.slot_size:
+            raise ValueError('packet of %d bytes does not fit a %d byte slot' % (length, self.slot_size))
+        pos = self.slots_pos + (tail % self.capacity) * self.stride
+        self.slot_struct.pack_into(self.buf, pos, pkt_type, length)
+        pos += self.slot_struct.size
+        self.buf[pos:pos + length] = pkt_S
+        self.index_struct.pack_into(self.buf, self.tail_pos, tail + 1)
+        return True
+
+    # copy the oldest packet out of the ring
+    # @return the packet, as it was put (str or bytes), None if the ring is empty
+    def get(self):
+        head = self.head()
+        if head == self.tail():
+            return None
+        pos = self.slots_pos + (head % self.capacity) * self.stride
+        pkt_type, length = self.slot_struct.unpack_from(self.buf, pos)
+        pos += self.slot_struct.size
+        pkt_S = bytes(self.buf[pos:pos + length])
+        self.index_struct.pack_into(self.buf, self.head_pos, head + 1)
+        if pkt_type == self.TEXT:
+            return pkt_S.decode()
+        return pkt_S
+
+    # detach from the shared memory block
+    def close(self):
+        if self.shm is not None:
+            self.buf = None
+            self.shm.close()
+
+    # detach from and free the shared memory block, called once by its creator
+    def unlink(self):
+        if self.shm is not None:
+            self.close()
+            self.shm.unlink()
+
+# EOF
@@ -1,71 +1,68 @@
 # simulation_3.py
 
 import network_3 as network
-import link_3 as link
+import aqm
+import metrics
+import packet_trace
+import path_mtu
+import qdisc
+import asyncio
+import runnable
+import sharding
+import simulator
 import threading
+import topology
 from time import sleep
-from rprint import print
+import rlog
+from rlog import log, INFO
 
 
 # configuration parameters
-router_queue_size = 0  # 0 means unlimited
+topology_file = 'topologies/simulation_3.json'  # hosts, routers, routes and links, see topology.py
+router_queue_size = 0  # 0 means unlimited, None for the sizes in the topology file
+router_scheduler = None  # scheduling of router outgoing interfaces, e.g. qdisc.make('drr'), None for the topology file's
+router_drop_policy = None  # drop policy of router outgoing interfaces, e.g. aqm.make('codel'), None for the topology file's
 simulation_time = 1  # give the network sufficient time to transfer all packets before quitting
+link_batch_pkts = 8  # packets a link may move per transfer pass
+link_bandwidth = None  # bytes per second, None for unlimited
+link_delay = 0  # seconds of propagation delay
+path_mtu_discovery = True  # routers report links packets did not fit to the sources, which then fragment to fit
+wire_format = network.NetworkPacket.BINARY  # or network.NetworkPacket.TEXT for the original text header
+collect_metrics = False  # count packets, bytes and drops per object and log them at the end
+trace_file = None  # file to capture every packet event to, read it back with packet_trace.py
+log_level = rlog.DEBUG  # rlog.INFO leaves out per-hop messages, rlog.OFF disables logging
+execution_mode = 'threads'  # 'threads' runs a thread per object, 'asyncio' a task per object on one event loop,
+                            # 'events' the single-threaded discrete-event simulator, 'processes' the nodes
+                            # split across worker_count processes
+worker_count = 2  # worker processes for the 'processes' mode
 
 if __name__ == '__main__':
-    object_L = []  # keeps track of objects, so we can kill their threads
+    network.NetworkPacket.wire_format = wire_format
+    rlog.set_level(log_level)
+    if trace_file is not None:
+        packet_trace.start(trace_file)
+    if collect_metrics:
+        metrics.start()
+    intf_class = network.AsyncInterface if execution_mode == 'asyncio' else network.Interface
     
-    # make clients
-    # client 1
-    client1 = network.Host(1)
-    object_L.append(client1)
-    # client 1
-    client2 = network.Host(2)
-    object_L.append(client2)
-    
-    # make servers
-    # server 1
-    server1 = network.Host(3)
-    object_L.append(server1)
-    # server 2
-    server2 = network.Host(4)
-    object_L.append(server2)
-    
-    # configure routers
-
-    # router A
-    router_a = network.Router(name='A', intf_count=2, max_queue_size=router_queue_size, routing_table={3: 0, 4: 1})
-    object_L.append(router_a)
-    # router B
-    router_b = network.Router(name='B', intf_count=1, max_queue_size=router_queue_size, routing_table={3: 0, 4: 0})
-    object_L.append(router_b)
-    # router C
-    router_c = network.Router(name='C', intf_count=1, max_queue_size=router_queue_size, routing_table={3: 0, 4: 0})
-    object_L.append(router_c)
-    # router D
-    router_d = network.Router(name='D', intf_count=2, max_queue_size=router_queue_size, routing_table={3: 0, 4: 1})
-    object_L.append(router_d)
-    
-    # create a Link Layer to keep track of links between network nodes
-    link_layer = link.LinkLayer()
-    object_L.append(link_layer)
-    
-    # add all the links
-    # link parameters: from_node, from_intf_num, to_node, to_intf_num, mtu
-    link_layer.add_link(link.Link(client1,  0, router_a, 0, 50))
-    link_layer.add_link(link.Link(client2,  0, router_a, 0, 50))
-    link_layer.add_link(link.Link(router_d, 0, server1,  0, 50))
-    link_layer.add_link(link.Link(router_d, 1, server2,  0, 50))
-    link_layer.add_link(link.Link(router_a, 0, router_b, 0, 50))
-    link_layer.add_link(link.Link(router_a, 1, router_c, 0, 50))
-    link_layer.add_link(link.Link(router_b, 0, router_d, 0, 50))
-    link_layer.add_link(link.Link(router_c, 0, router_d, 0, 50))
-
-
+    # build the hosts, routers and links described in the topology file
+    topo = topology.load(topology_file, intf_class, router_queue_size, router_scheduler, router_drop_policy,
+                         batch_pkts=link_batch_pkts, bandwidth=link_bandwidth, delay=link_delay)
+    if path_mtu_discovery:
+        path_mtu.enable(topo.host_D.values(), topo.router_D.values())
+    object_L = topo.object_L()  # keeps track of objects, so we can kill their threads
+    client1 = topo.host(1)
+    client2 = topo.host(2)
     
     # start all the objects
-    thread_L = [threading.Thread(name=object.__str__(), target=object.run) for object in object_L]
-    for t in thread_L:
-        t.start()
+    if execution_mode == 'events':
+        sim = simulator.Simulator(object_L)
+        if packet_trace.writer is not None:
+            packet_trace.writer.clock = sim.clock  # timestamp events in virtual time
+    elif execution_mode == 'threads':
+        thread_L = [threading.Thread(name=object.__str__(), target=object.run) for object in object_L]
+        for t in thread_L:
+            t.start()
 
     # lets send multiple messages
     msgOne = 'Sample data: 1xyz'
@@ -77,15 +74,34 @@ if __name__ == '__main__':
     client2.udt_send(4, msgTwo, 2)
     client2.udt_send(4, msgThree, 3)
     
-    # give the network sufficient time to transfer all packets before quitting
-    sleep(simulation_time)
+    if execution_mode == 'events':
+        # run until every packet has been delivered
+        log(INFO, 'Simulation quiescent at virtual time %.6f', sim.run())
+    elif execution_mode == 'asyncio':
+        # the objects run as tasks until stopped after simulation_time
+        asyncio.run(runnable.run_async(object_L, simulation_time))
+        log(INFO, "All simulation tasks finished")
+    elif execution_mode == 'processes':
+        # workers are forked with the packets sent above already queued
+        sharding.ShardedNetwork(object_L, worker_count).run(simulation_time)
+        log(INFO, "All simulation workers joined")
+    else:
+        # give the network sufficient time to transfer all packets before quitting
+        sleep(simulation_time)
+        
+        # join all threads
+        for o in object_L:
+            o.stop = True
+        for t in thread_L:
+            t.join()
+        
+        log(INFO, "All simulation threads joined")
     
-    # join all threads
-    for o in object_L:
-        o.stop = True
-    for t in thread_L:
-        t.join()
+    topo.close()
     
-    print("All simulation threads joined")
+    if collect_metrics:
+        log(INFO, 'Metrics:\n%s', metrics.format_snapshot(metrics.stop()))
+    if trace_file is not None:
+        packet_trace.stop()
 
 # EOF
\ No newline at end of file
@@ -0,0 +1,111 @@
+# simulator.py
+
+from collections import deque
+from scheduler import Scheduler
+
+
+# Single-threaded discrete-event engine driving hosts, routers and links,
+# an alternative to running a thread per object.
+# Time is virtual: it jumps from one timed event (a packet finishing a link,
+# a scheduled call) to the next, and between events only the objects that
+# were notified of new packets are polled. The run ends as soon as nothing is
+# queued or in flight, and the same inputs always give the same results.
+class Simulator:
+
+    # @param object_L: hosts, routers and link layers, as started by the threaded simulations
+    def __init__(self, object_L):
+        self.now = 0.0
+        self.event_count = 0  # number of timed events processed
+        self.poll_count = 0  # number of times a node or link was polled
+        self.events = Scheduler(self.clock)  # scheduled calls
+        self.scheduler_L = []  # packets in flight on each link layer
+        self.ready_Q = deque()  # (object, poll function) to run, in notification order
+        self.ready_S = set()  # ids of the objects in ready_Q
+        for obj in object_L:
+            if hasattr(obj, 'link_L'):
+                self.add_link_layer(obj)
+            else:
+                self.add_node(obj)
+
+    # called when printing the object
+    def __str__(self):
+        return 'Simulator'
+
+    # the virtual time, used as the clock of the link layers and hosts
+    def clock(self):
+        return self.now
+
+    # drive a host or router: poll it whenever a packet arrives on one of its interfaces
+    def add_node(self, node):
+        for intf in node.in_intf_L:
+            intf.add_listener(lambda node=node: self.ready(node, node.poll))
+        if hasattr(node, 'reassembler'):
+            node.reassembler.clock = self.clock
+            node.pmtu_cache.clock = self.clock
+        for intf in node.out_intf_L:
+            if intf.drop_policy is not None:
+                intf.drop_policy.clock = self.clock  # sojourn times in virtual time
+        self.ready(node, node.poll)
+
+    # drive the links of a link layer: poll a link whenever a packet is sent on it
+    def add_link_layer(self, link_layer):
+        link_layer.scheduler.clock = self.clock
+        self.scheduler_L.append(link_layer.scheduler)
+        for link in link_layer.link_L:
+            link.in_intf.add_listener(lambda link=link: self.ready(link, link.tx_pkt))
+            self.ready(link, link.tx_pkt)
+
+    # queue an object to be polled
+    # @param obj: host, router or link
+    # @param poll: function processing its queued packets and returning how many it handled
+    def ready(self, obj, poll):
+        if id(obj) not in self.ready_S:
+            self.ready_S.add(id(obj))
+            self.ready_Q.append((obj, poll))
+
+    # call a function at a virtual time, e.g. Host.udt_send
+    # @param when: virtual time in seconds
+    # @param fn: function to call
+    # @param args: arguments to the function
+    def at(self, when, fn, *args):
+        self.events.schedule(when, (fn, args))
+
+    # poll the notified objects until none has anything left to process
+    def drain(self):
+        while self.ready_Q:
+            obj, poll = self.ready_Q.popleft()
+            self.ready_S.discard(id(obj))
+            while poll():
+                self.poll_count += 1
+
+    # time of the next timed event, None if there is none
+    def next_time(self):
+        time_L = [s.next_time() for s in [self.events] + self.scheduler_L]
+        time_L = [t for t in time_L if t is not None]
+        return min(time_L) if time_L else None
+
+    # run until the network is quiescent
+    # @param until: virtual time at which to stop even if packets are still in flight, None for no limit
+    # @return the virtual time at which the run ended
+    def run(self, until=None):
+        while True:
+            self.drain()
+            when = self.next_time()
+            if when is None:
+                return self.now  # nothing queued or in flight
+            if until is not None and when > until:
+                self.now = until
+                return self.now
+            self.now = max(self.now, when)
+            for fn, args in self.events.pop_due():
+                self.event_count += 1
+                fn(*args)
+            for scheduler in self.scheduler_L:
+                for link, pkt_S in scheduler.pop_due():
+                    self.event_count += 1
+                    if pkt_S is None:
+                        self.ready(link, link.tx_pkt)  # the link finished transmitting, send the next packet
+                    else:
+                        link.deliver(pkt_S)
+
+# EOF
@@ -0,0 +1,116 @@
+# test_batch_forward.py
+
+import random
+import unittest
+import metrics
+import network_3 as network
+import rlog
+import batch_forward
+
+
+# routers A and B in a line, A's interface 0 feeding B
+def make_routers(mtu_A_L, mtu_B):
+    router_A = network.Router('A', len(mtu_A_L), 0, {3: 0, 4: 1})
+    for intf, mtu in zip(router_A.out_intf_L, mtu_A_L):
+        intf.mtu = mtu
+    router_B = network.Router('B', 1, 0, {3: 0, 4: 0})
+    router_B.out_intf_L[0].mtu = mtu_B
+    return router_A, router_B
+
+
+# the packets queued on the outgoing interfaces of a router, emptying them
+def drain(router):
+    return [intf.get_batch(1 << 30) for intf in router.out_intf_L]
+
+
+@unittest.skipIf(batch_forward.np is None, 'NumPy is not installed')
+class BatchForwardTest(unittest.TestCase):
+
+    def setUp(self):
+        rlog.set_level(rlog.OFF)
+        network.NetworkPacket.wire_format = network.NetworkPacket.BINARY
+
+    # forward through A then B per packet, and as batches
+    # @return (per packet result, batch result), each the packets queued on B
+    def chain(self, pkt_L, mtu_A_L, mtu_B):
+        router_A, router_B = make_routers(mtu_A_L, mtu_B)
+        for pkt_S in pkt_L:
+            router_A.forward_packet(pkt_S, 0)
+        for pkt_S in drain(router_A)[0]:
+            router_B.forward_packet(pkt_S, 0)
+        scalar_L = drain(router_B)
+        router_A, router_B = make_routers(mtu_A_L, mtu_B)
+        out_D = batch_forward.BatchForwarder(router_A).forward(batch_forward.PacketBatch.from_packets(pkt_L))
+        batch_forward.BatchForwarder(router_B).forward_packets(out_D[0].packets())
+        batch_L = drain(router_B)
+        # and without turning A's output into byte strings first
+        router_A, router_B = make_routers(mtu_A_L, mtu_B)
+        out_D = batch_forward.BatchForwarder(router_A).forward(batch_forward.PacketBatch.from_packets(pkt_L))
+        batch_forward.BatchForwarder(router_B).deliver(batch_forward.BatchForwarder(router_B).forward(out_D[0]))
+        self.assertEqual(batch_L, drain(router_B))
+        return scalar_L, batch_L
+
+    def test_chained_fragmentation(self):
+        pkt_L = [network.NetworkPacket(3, b'x' * n, i).to_byte_S() for i, n in enumerate((20, 100, 20, 100))]
+        scalar_L, batch_L = self.chain(pkt_L, (60, 200), 30)
+        self.assertEqual(scalar_L, batch_L)
+        self.assertTrue(scalar_L[0])
+
+    def test_short_packets_in_batch(self):
+        pkt_L = [network.NetworkPacket(3, b'x' * n, i).to_byte_S() for i, n in enumerate((20, 100, 20, 100))]
+        pkt_L[1:1] = [b'', pkt_L[0][:5], pkt_L[0][:17]]
+        metrics.start()
+        try:
+            router_A, router_B = make_routers((60, 200), 30)
+            for pkt_S in pkt_L:
+                router_A.forward_packet(pkt_S, 0)
+            scalar_L = drain(router_A)
+            scalar_D = metrics.snapshot()[str(router_A)]
+            metrics.start()
+            router_A, router_B = make_routers((60, 200), 30)
+            batch_forward.BatchForwarder(router_A).forward_packets(pkt_L)
+            batch_L = drain(router_A)
+            batch_D = metrics.snapshot()[str(router_A)]
+        finally:
+            metrics.stop()
+        self.assertEqual(scalar_L, batch_L)
+        self.assertEqual(len(batch_L[0]), 2 + 2 * 3)
+        for name in ('drop_malformed', 'pkts_out', 'fragments'):
+            self.assertEqual(scalar_D[name], batch_D[name])
+        self.assertEqual(batch_D['drop_malformed'], 3)
+
+    def test_chained_random(self):
+        rng = random.Random(1)
+        pkt_L = [network.NetworkPacket(rng.choice((3, 4, 5)), bytes(rng.randrange(256) for _ in range(rng.randrange(300))),
+                                       i, rng.randrange(2), rng.randrange(1000), rng.randrange(9)).to_byte_S()
+                 for i in range(300)]
+        scalar_L, batch_L = self.chain(pkt_L, (70, 150), 40)
+        self.assertEqual(scalar_L, batch_L)
+
+
+# the per-packet path the batch path must match, runs without NumPy
+class ForwardPacketTest(unittest.TestCase):
+
+    def setUp(self):
+        rlog.set_level(rlog.OFF)
+        network.NetworkPacket.wire_format = network.NetworkPacket.BINARY
+
+    def test_short_packet_dropped_as_malformed(self):
+        router_A, _ = make_routers((60, 200), 30)
+        pkt_S = network.NetworkPacket(3, b'x' * 20, 1).to_byte_S()
+        metrics.start()
+        try:
+            for p in (pkt_S[:5], pkt_S, b''):
+                router_A.forward_packet(p, 0)
+            counter_D = metrics.snapshot()[str(router_A)]
+        finally:
+            metrics.stop()
+        self.assertEqual(drain(router_A)[0], [pkt_S])
+        self.assertEqual(counter_D['drop_malformed'], 2)
+        self.assertEqual(counter_D['pkts_out'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+# EOF
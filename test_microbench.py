@@ -0,0 +1,36 @@
+# test_microbench.py
+
+import contextlib
+import io
+import unittest
+import microbench
+import network_3 as network
+
+
+class MicrobenchTest(unittest.TestCase):
+
+    def tearDown(self):
+        network.NetworkPacket.wire_format = network.NetworkPacket.BINARY
+
+    # the example of the usage, with short trials
+    def test_compare_wire_formats(self):
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            status = microbench.main(['--compare', 'network_3:binary', 'network_3:text',
+                                      '--trials', '2', '--warmup', '0', '--min-time', '0.0001'])
+        self.assertEqual(status, 0)
+        line_L = out.getvalue().splitlines()
+        self.assertEqual(len(line_L), 2 * 3 + 2 * 2 * 3)  # encoding and decoding by payload, sending by MTU too
+        # a 4096 byte payload at MTU 50 has fragment offsets too wide for the text header
+        for bench in ('udt_send', 'handle_frag'):
+            case_L = [line for line in line_L
+                      if line.startswith(bench) and 'payload=4096' in line and 'mtu=50 ' in line]
+            self.assertEqual(len(case_L), 1)
+            self.assertIn('network_3:text: n/a', case_L[0])
+            self.assertNotIn('network_3:binary: n/a', case_L[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+# EOF
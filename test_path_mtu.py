@@ -0,0 +1,58 @@
+# test_path_mtu.py
+
+import unittest
+from path_mtu import PathMtuCache
+
+
+# a clock set by hand, which can run a change of the cache when read,
+# as if another thread made it at that moment
+class Clock:
+
+    def __init__(self):
+        self.now = 0.0
+        self.change = None
+
+    def __call__(self):
+        change, self.change = self.change, None
+        if change is not None:
+            change()
+        return self.now
+
+
+class PathMtuCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = Clock()
+        self.cache = PathMtuCache(expiry=10.0, clock=self.clock)
+
+    def test_keeps_smallest_mtu_until_expiry(self):
+        self.cache.update(3, 40)
+        self.cache.update(3, 60)  # larger, ignored
+        self.cache.update(3, 30)
+        self.clock.now = 9.0
+        self.assertEqual(self.cache.get(3), 30)
+        self.clock.now = 10.0
+        self.assertIsNone(self.cache.get(3))
+        self.assertEqual(len(self.cache), 0)
+        self.cache.update(3, 60)  # after expiry a larger MTU is accepted
+        self.assertEqual(self.cache.get(3), 60)
+
+    def test_expiry_keeps_entry_reported_meanwhile(self):
+        self.cache.update(3, 40)
+        self.clock.now = 20.0
+        self.clock.change = lambda: self.cache.mtu_D.__setitem__(3, (50, 20.0))
+        self.assertIsNone(self.cache.get(3))
+        self.assertEqual(self.cache.get(3), 50)
+
+    def test_expiry_of_entry_cleared_meanwhile(self):
+        self.cache.update(3, 40)
+        self.clock.now = 20.0
+        self.clock.change = self.cache.clear
+        self.assertIsNone(self.cache.get(3))
+        self.assertEqual(len(self.cache), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+# EOF
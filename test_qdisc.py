@@ -0,0 +1,58 @@
+# test_qdisc.py
+
+import unittest
+import network_3 as network
+import qdisc
+import topology
+
+
+# a binary packet of a flow, padded to length bytes
+def packet(src_addr, dst_addr, length, tclass=0):
+    header_length = network.NetworkPacket.header_struct.size
+    return network.NetworkPacket(dst_addr, b'x' * (length - header_length), 1, 0, 0, src_addr, tclass).to_byte_S()
+
+
+class QdiscTest(unittest.TestCase):
+
+    def setUp(self):
+        network.NetworkPacket.wire_format = network.NetworkPacket.BINARY
+
+    def test_priority_order(self):
+        q = qdisc.PriorityQueue()
+        for tclass in (0, 5, 9, 5):
+            q.put(packet(1, 2, 40, tclass))
+        self.assertEqual([network.NetworkPacket.peek_tclass(q.get()) for _ in range(4)], [9, 5, 5, 0])
+
+    def test_drr_shares_bytes_by_weight(self):
+        q = qdisc.DrrQueue(quantum=100, weight=lambda flow: 2 if flow[0] == 1 else 1)
+        for _ in range(30):
+            q.put(packet(1, 3, 100))
+            q.put(packet(2, 3, 100))
+        src_L = [network.NetworkPacket.peek_src_addr(q.get()) for _ in range(30)]
+        self.assertEqual(src_L.count(1), 20)
+        self.assertEqual(src_L.count(2), 10)
+
+    def test_drr_rejects_non_positive_quantum(self):
+        for quantum in (0, -1):
+            with self.assertRaises(ValueError):
+                qdisc.DrrQueue(quantum=quantum)
+
+    def test_zero_weight_is_refused_not_spun_on(self):
+        for q in (qdisc.DrrQueue(weight=lambda flow: 0), qdisc.WfqQueue(weight=lambda flow: 0)):
+            with self.assertRaises(ValueError):
+                q.put(packet(1, 2, 40))
+            self.assertEqual(q.qsize(), 0)
+
+    def test_validate_reports_bad_quantum(self):
+        spec_D = {'hosts': [{'addr': 1}],
+                  'routers': [{'name': 'A', 'intf_count': 1, 'scheduler': {'name': 'drr', 'quantum': 0}}],
+                  'links': [{'from': 1, 'to': 'A', 'mtu': 50}]}
+        error_L = topology.validate(spec_D)
+        self.assertEqual(len(error_L), 1)
+        self.assertIn('quantum', error_L[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+# EOF
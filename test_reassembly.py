@@ -0,0 +1,60 @@
+# test_reassembly.py
+
+import unittest
+from reassembly import Reassembler
+
+
+# a clock set by hand
+class Clock:
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class ReassemblerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = Clock()
+        self.reassembler = Reassembler(timeout=10.0, max_bytes=100, clock=self.clock)
+
+    def test_out_of_order(self):
+        data_S = bytes(range(30))
+        self.assertIsNone(self.reassembler.add(1, 7, 20, 0, data_S[20:]))
+        self.assertIsNone(self.reassembler.add(1, 7, 0, 1, data_S[:10]))
+        self.assertEqual(self.reassembler.add(1, 7, 10, 1, data_S[10:20]), data_S)
+        self.assertEqual((len(self.reassembler), self.reassembler.buffered), (0, 0))
+
+    def test_overlap_at_other_offset_is_not_counted_twice(self):
+        data_S = b'abcdefghijklmnopqrst'
+        self.assertIsNone(self.reassembler.add(1, 7, 0, 1, data_S[:10]))
+        self.assertIsNone(self.reassembler.add(1, 7, 5, 1, data_S[5:15]))  # refragmented differently
+        self.assertIsNone(self.reassembler.add(1, 7, 17, 0, data_S[17:]))  # 15-17 still missing
+        self.assertEqual(self.reassembler.buffered, 18)
+        self.assertEqual(self.reassembler.add(1, 7, 12, 1, data_S[12:17]), data_S)
+        self.assertEqual(self.reassembler.buffered, 0)
+
+    def test_text_overlap(self):
+        self.assertIsNone(self.reassembler.add(1, 7, 0, 1, 'abcdef'))
+        self.assertIsNone(self.reassembler.add(1, 7, 4, 1, 'efgh'))
+        self.assertIsNone(self.reassembler.add(1, 7, 4, 1, 'efgh'))  # duplicate
+        self.assertEqual(self.reassembler.add(1, 7, 8, 0, 'ij'), 'abcdefghij')
+
+    def test_expiry_and_memory_budget(self):
+        self.reassembler.add(1, 1, 0, 1, bytes(60))
+        self.clock.now = 5.0
+        self.reassembler.add(1, 2, 0, 1, bytes(30))
+        self.assertEqual(self.reassembler.next_expiry(), 10.0)
+        self.clock.now = 10.0
+        self.reassembler.expire()
+        self.assertEqual((len(self.reassembler), self.reassembler.buffered), (1, 30))
+        self.reassembler.add(1, 3, 0, 1, bytes(80))  # over the budget, the oldest goes
+        self.assertEqual((len(self.reassembler), self.reassembler.buffered, self.reassembler.evicted), (1, 80, 2))
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+# EOF
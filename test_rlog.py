@@ -0,0 +1,68 @@
+# test_rlog.py
+
+import contextlib
+import io
+import os
+import tempfile
+import unittest
+import rlog
+
+
+class RlogTest(unittest.TestCase):
+
+    def setUp(self):
+        self.level = rlog.level
+        rlog.set_level(rlog.DEBUG)
+
+    def tearDown(self):
+        rlog.set_output(None)
+        rlog.set_level(self.level)
+
+    # log messages and flush them to a captured standard output
+    # @param record_L: (level, format string, arguments...) of each message
+    # @return the output
+    def captured(self, *record_L):
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            for record in record_L:
+                rlog.log(*record)
+            rlog.flush()
+        return out.getvalue()
+
+    def test_writes_to_current_stdout(self):
+        self.assertEqual(self.captured((rlog.INFO, '%s sent %d', 'Host_1', 3)), 'Host_1 sent 3\n')
+
+    def test_level_filters(self):
+        rlog.set_level(rlog.ERROR)
+        self.assertEqual(self.captured((rlog.DEBUG, 'hop'), (rlog.ERROR, 'lost %d', 1)), 'lost 1\n')
+
+    def test_mutable_arguments_logged_as_they_were(self):
+        state_L = [1]
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            rlog.log(rlog.INFO, 'state %s', state_L)
+            state_L.append(2)
+            rlog.flush()
+        self.assertEqual(out.getvalue(), 'state [1]\n')
+
+    def test_set_output_closes_files_it_opened(self):
+        with tempfile.TemporaryDirectory() as dir_S:
+            path_L = [os.path.join(dir_S, name) for name in ('a.log', 'b.log')]
+            rlog.set_output(path_L[0])
+            first = rlog._file
+            rlog.log(rlog.INFO, 'to a')
+            rlog.set_output(path_L[1])
+            self.assertTrue(first.closed)
+            rlog.log(rlog.INFO, 'to b')
+            second = rlog._file
+            rlog.set_output(None)
+            self.assertTrue(second.closed)
+            for path, line in zip(path_L, ('to a\n', 'to b\n')):
+                with open(path) as f:
+                    self.assertEqual(f.read(), line)
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+# EOF
@@ -0,0 +1,88 @@
+# test_routing_table.py
+
+import sys
+import threading
+import unittest
+from routing_table import RoutingTable
+
+
+# routes changed, as if by another thread, once while the table is compiled from them
+class ChangingRoutes(dict):
+
+    def items(self):
+        change, self.change = self.change, None
+        if change is not None:
+            change()
+        return dict.items(self)
+
+
+class RoutingTableTest(unittest.TestCase):
+
+    def test_longest_prefix_wins(self):
+        table = RoutingTable({5: 3}, default=0, addr_bits=8)
+        table.add_prefix(0, 1, 1)  # 0-127
+        table.add_prefix(0, 4, 2)  # 0-15
+        table.add_range(100, 110, 4)
+        self.assertEqual([table.get(a) for a in (5, 6, 16, 105, 111, 200)], [3, 2, 1, 4, 1, 0])
+        table.remove_range(100, 110)
+        self.assertEqual(table.get(105), 1)
+
+    def test_no_route(self):
+        table = RoutingTable({1: 0})
+        self.assertIsNone(table.get(2))
+        self.assertEqual(table.get(2, -1), -1)
+
+    def test_bad_prefix_and_range(self):
+        table = RoutingTable()
+        with self.assertRaises(ValueError):
+            table.add_prefix(0, 40, 0)
+        with self.assertRaises(ValueError):
+            table.add_range(9, 3, 0)
+
+    def test_change_during_compile_not_lost(self):
+        table = RoutingTable({addr: 0 for addr in range(0, 20, 2)}, default=1)
+        table.route_D = ChangingRoutes(table.route_D)
+        table.route_D.change = lambda: table.add_host(7, 2)
+        self.assertIn(table.get(7), (1, 2))  # before or after the change
+        self.assertIsNone(table.index)  # the index built during the change is not kept
+        self.assertEqual(table.get(7), 2)
+
+    # routers look addresses up while routing.py updates their tables from another thread
+    def test_get_during_concurrent_changes(self):
+        table = RoutingTable({addr: 0 for addr in range(0, 200, 2)}, default=1)
+        error_L = []
+        stop = threading.Event()
+
+        def update():
+            route_D = {addr: 2 for addr in range(1, 200, 2)}
+            while not stop.is_set():
+                table.add_hosts(route_D)
+                table.remove_hosts(list(route_D))
+
+        def look_up():
+            try:
+                for _ in range(20000):
+                    for addr in (0, 1, 150, 151):
+                        if table.get(addr) not in (0, 1, 2):
+                            error_L.append('bad interface for %d' % addr)
+            except Exception as e:
+                error_L.append(repr(e))
+
+        interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        try:
+            updater = threading.Thread(target=update)
+            updater.start()
+            look_up()
+            stop.set()
+            updater.join()
+        finally:
+            sys.setswitchinterval(interval)
+        self.assertEqual(error_L, [])
+        self.assertEqual(table.get(151), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+# EOF
@@ -0,0 +1,64 @@
+# test_topology.py
+
+import unittest
+import topology
+
+
+# a valid description of two hosts linked through a router
+def spec():
+    return {'hosts': [{'addr': 1}, {'addr': 2}],
+            'routers': [{'name': 'A', 'intf_count': 2, 'routes': {'2': 1}}],
+            'links': [{'from': 1, 'to': 'A', 'mtu': 50}, {'from': 'A', 'from_intf': 1, 'to': 2, 'mtu': 50}]}
+
+
+class ValidateTest(unittest.TestCase):
+
+    # @return the problems found in the description after changing it with fn
+    def errors(self, fn):
+        spec_D = spec()
+        fn(spec_D)
+        return topology.validate(spec_D)
+
+    def test_valid(self):
+        self.assertEqual(topology.validate(spec()), [])
+        topo = topology.build(spec(), delay=0.001)
+        self.assertEqual(len(topo.link_layer.link_L), 2)
+        topo.close()
+
+    def test_link_layer_settings(self):
+        for layer_D in ({'batch_size': 8}, {'batch_pkts': 0}, {'batch_pkts': None}, {'batch_bytes': -1},
+                        {'bandwidth': 0}, {'bandwidth': '1e6'}, {'delay': -0.1}, {'delay': None}):
+            error_L = self.errors(lambda spec_D: spec_D.update(link_layer=layer_D))
+            self.assertEqual(len(error_L), 1, layer_D)
+            self.assertIn('link layer', error_L[0])
+        self.assertEqual(len(self.errors(lambda spec_D: spec_D.update(link_layer=[8]))), 1)
+        error_L = self.errors(lambda spec_D: spec_D.update(link_layer={'batch_bytes': None, 'bandwidth': 1e6}))
+        self.assertEqual(error_L, [])
+
+    def test_link_settings(self):
+        for setting_D in ({'batch_pkts': -1}, {'batch_bytes': 0}, {'bandwidth': 0}, {'delay': -1}):
+            error_L = self.errors(lambda spec_D: spec_D['links'][0].update(setting_D))
+            self.assertEqual(len(error_L), 1, setting_D)
+            self.assertIn('link 0', error_L[0])
+        setting_D = {'batch_pkts': None, 'bandwidth': None, 'delay': None}  # the link layer's
+        self.assertEqual(self.errors(lambda spec_D: spec_D['links'][0].update(setting_D)), [])
+
+    def test_bool_interface_numbers(self):
+        self.assertEqual(len(self.errors(lambda spec_D: spec_D['links'][1].update(from_intf=True))), 1)
+        self.assertEqual(len(self.errors(lambda spec_D: spec_D['routers'][0]['routes'].update({'2': True}))), 1)
+
+    def test_entries_not_objects(self):
+        for key, entry in (('hosts', 3), ('routers', 'A'), ('links', [1, 'A'])):
+            error_L = self.errors(lambda spec_D: spec_D[key].append(entry))
+            self.assertEqual(len(error_L), 1, key)
+            self.assertIn('not an object', error_L[0])
+
+    def test_build_rejects_bad_override(self):
+        with self.assertRaises(ValueError):
+            topology.build(spec(), bandwidth=0)
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+# EOF
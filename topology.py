@@ -0,0 +1,302 @@
+# topology.py
+'''
+Declarative topologies: build hosts, routers and links from a description
+instead of by hand in each simulation script.
+
+A description is a JSON file, or the equivalent dictionary for generated
+topologies:
+
+    {
+        "hosts": [{"addr": 1}, {"addr": 2}],
+        "routers": [{"name": "A", "intf_count": 2, "max_queue_size": 0, "intf_budget": 8,
+                     "routes": {"2": 1}, "prefixes": [[0, 24, 0]],
+                     "ranges": [[100, 199, 1]], "default": null,
+                     "scheduler": {"name": "drr", "quantum": 1500},
+                     "drop_policy": {"name": "codel", "target": 0.005}}],
+        "links": [{"from": 1, "from_intf": 0, "to": "A", "to_intf": 0, "mtu": 50}],
+        "link_layer": {"batch_pkts": 8, "batch_bytes": null, "bandwidth": null, "delay": 0},
+        "routing": "static"
+    }
+
+Links name hosts by address (a number) and routers by name (a string), and
+may set their own batch_pkts, batch_bytes, bandwidth and delay, overriding
+those of the link layer.
+Router routes map destination addresses to interface numbers; prefixes are
+[prefix, length, interface] and ranges [first, last, interface] (see
+RoutingTable). A router scheduler is the name of a scheduling discipline of
+its outgoing interfaces and its parameters, or just the name (see qdisc.py),
+and so is its drop policy (see aqm.py); both are made once while validating,
+so that unknown parameters are reported with the other problems.
+Everything but the host addresses, router names and link ends
+is optional. With "routing": "shortest_path", host routes are computed from
+the links (see routing.py) on top of the routes given. The description is
+validated as a whole before anything is built, and the routing table of every
+router is compiled up front, so the first packets do not pay for it.
+'''
+
+import aqm
+import json
+import link_3 as link
+import network_3 as network
+import qdisc
+import routing
+from routing_table import RoutingTable
+
+
+# A network built from a description.
+class Topology:
+
+    def __init__(self):
+        self.host_D = {}  # address -> Host
+        self.router_D = {}  # name -> Router
+        self.link_layer = None
+        self.routing = None  # ShortestPathRouting, if the routes are computed
+
+    # called when printing the object
+    def __str__(self):
+        return 'Topology of %d hosts, %d routers and %d links' % (
+            len(self.host_D), len(self.router_D), len(self.link_layer.link_L))
+
+    # the host with an address
+    def host(self, addr):
+        return self.host_D[addr]
+
+    # the router with a name
+    def router(self, name):
+        return self.router_D[name]
+
+    # the hosts, routers and link layer, in the order the simulations start them
+    def object_L(self):
+        return list(self.host_D.values()) + list(self.router_D.values()) + [self.link_layer]
+
+    # free the interfaces of the hosts and routers once they have stopped
+    def close(self):
+        for node in list(self.host_D.values()) + list(self.router_D.values()):
+            node.close()
+
+
+# read a description from a JSON file and build it
+# @param path: JSON file
+# @param intf_class: interface class of the hosts and routers, e.g. network.AsyncInterface
+# @param max_queue_size: router queue size overriding those of the description, None to keep them
+# @param scheduler: router scheduler (see qdisc.make) overriding those of the description, None to keep them
+# @param drop_policy: router drop policy (see aqm.make) overriding those of the description, None to keep them
+# @param link_layer_D: link layer settings overriding those of the description
+# @return Topology
+def load(path, intf_class=network.Interface, max_queue_size=None, scheduler=None, drop_policy=None, **link_layer_D):
+    with open(path) as f:
+        spec_D = json.load(f)
+    return build(spec_D, intf_class, max_queue_size, scheduler, drop_policy, **link_layer_D)
+
+
+# @return True if x is a non-negative integer
+def is_natural(x):
+    return isinstance(x, int) and not isinstance(x, bool) and x >= 0
+
+
+# @return True if x is an integer or a float, but not a bool
+def is_number(x):
+    return isinstance(x, (int, float)) and not isinstance(x, bool)
+
+
+# link layer settings, each with its test and what the test requires
+link_setting_D = {
+    'batch_pkts': (lambda x: is_natural(x) and x > 0, 'a positive integer'),
+    'batch_bytes': (lambda x: x is None or is_natural(x) and x > 0, 'a positive integer or null'),
+    'bandwidth': (lambda x: x is None or is_number(x) and x > 0, 'a positive number or null'),
+    'delay': (lambda x: is_number(x) and x >= 0, 'a non-negative number'),
+}
+
+
+# check link layer settings, of the link layer or of a single link
+# @param desc: what the settings are of, for the problems reported
+# @param setting_D: settings by name
+# @param on_link: True for the settings of a link, which ignores other keys and takes null for the link layer's
+# @return list of the problems found
+def check_link_settings(desc, setting_D, on_link=False):
+    error_L = []
+    for key, value in setting_D.items():
+        if key not in link_setting_D:
+            if not on_link:
+                error_L.append('%s: unknown setting %r, not one of %s' % (desc, key, ', '.join(link_setting_D)))
+            continue
+        valid, requirement = link_setting_D[key]
+        if not (on_link and value is None) and not valid(value):
+            error_L.append('%s: %s %r is not %s' % (desc, key, value, requirement))
+    return error_L
+
+
+# check a router scheduler or drop policy by making one
+# @param spec: name of the discipline, or dictionary of its name and parameters
+# @param class_D: the disciplines known, by name
+# @param new: function making a discipline from a name and parameters
+# @return the problem found, None if there is none
+def check_discipline(spec, class_D, new):
+    param_D = dict(spec) if isinstance(spec, dict) else {'name': spec}
+    name = param_D.pop('name', None)
+    if not isinstance(name, str) or name not in class_D:
+        return '%r is unknown, not one of %s' % (name, ', '.join(class_D))
+    try:
+        new(name, **param_D)
+    except (TypeError, ValueError) as e:
+        return '%s: %s' % (name, e)
+    return None
+
+
+# check a description
+# @param spec_D: description, as read from JSON
+# @return list of the problems found, empty if the description is valid
+def validate(spec_D):
+    error_L = []
+    addr_bits = RoutingTable().addr_bits  # address width of the prefixes built
+    if spec_D.get('routing', 'static') not in ('static', 'shortest_path'):
+        error_L.append('unknown routing %r, not static or shortest_path' % (spec_D['routing'],))
+    intf_count_D = {}  # host address or router name -> interface count
+    for h in spec_D.get('hosts', []):
+        if not isinstance(h, dict):
+            error_L.append('host %r is not an object' % (h,))
+            continue
+        addr = h.get('addr')
+        if not isinstance(addr, int) or isinstance(addr, bool) or addr < 0:
+            error_L.append('host address %r is not a non-negative integer' % (addr,))
+        elif addr in intf_count_D:
+            error_L.append('duplicate host address %d' % addr)
+        else:
+            intf_count_D[addr] = 1
+    for r in spec_D.get('routers', []):
+        if not isinstance(r, dict):
+            error_L.append('router %r is not an object' % (r,))
+            continue
+        name = r.get('name')
+        intf_count = r.get('intf_count', 1)
+        if not isinstance(name, str):
+            error_L.append('router name %r is not a string' % (name,))
+            continue
+        if name in intf_count_D:
+            error_L.append('duplicate router name %s' % name)
+            continue
+        if not is_natural(intf_count) or intf_count < 1:
+            error_L.append('router %s: interface count %r is not a positive integer' % (name, intf_count))
+            continue
+        intf_budget = r.get('intf_budget', 8)
+        if not is_natural(intf_budget) or intf_budget < 1:
+            error_L.append('router %s: interface budget %r is not a positive integer' % (name, intf_budget))
+        intf_count_D[name] = intf_count
+        intf_L = []  # interface numbers routed to
+        routes = r.get('routes', {})
+        if not isinstance(routes, dict):
+            error_L.append('router %s: routes %r are not an {address: interface} object' % (name, routes))
+        else:
+            for addr, intf in routes.items():
+                if not str(addr).isdigit():
+                    error_L.append('router %s: route to address %r is not a number' % (name, addr))
+                intf_L.append(intf)
+        for key, shape in (('prefixes', '[prefix, length, interface]'), ('ranges', '[first, last, interface]')):
+            entry_L = r.get(key, [])
+            if not isinstance(entry_L, (list, tuple)):
+                error_L.append('router %s: %s %r are not a list' % (name, key, entry_L))
+                continue
+            for entry in entry_L:
+                if not isinstance(entry, (list, tuple)) or len(entry) != 3 or not all(map(is_natural, entry[:2])):
+                    error_L.append('router %s: %s entry %r is not %s of non-negative integers'
+                                   % (name, key, entry, shape))
+                    continue
+                intf_L.append(entry[2])
+                if key == 'prefixes' and entry[1] > addr_bits:
+                    error_L.append('router %s: prefix %r longer than %d bits' % (name, entry, addr_bits))
+                elif key == 'ranges' and entry[0] > entry[1]:
+                    error_L.append('router %s: range %r ends before it starts' % (name, entry))
+        if r.get('default') is not None:
+            intf_L.append(r['default'])
+        for intf in intf_L:
+            if not is_natural(intf) or intf >= intf_count:
+                error_L.append('router %s: route to interface %r, it has %d' % (name, intf, intf_count))
+        error = check_discipline(r.get('scheduler', 'fifo'), qdisc.scheduler_D, lambda n, **p: qdisc.make(n, **p)(0))
+        if error is not None:
+            error_L.append('router %s: scheduler %s' % (name, error))
+        error = check_discipline(r.get('drop_policy', 'none'), aqm.policy_D, lambda n, **p: aqm.make(n, **p)())
+        if error is not None:
+            error_L.append('router %s: drop policy %s' % (name, error))
+    link_layer = spec_D.get('link_layer', {})
+    if not isinstance(link_layer, dict):
+        error_L.append('link layer %r is not an object' % (link_layer,))
+    else:
+        error_L.extend(check_link_settings('link layer', link_layer))
+    header_length = network.NetworkPacket.header_length()
+    out_intf_D = {}  # (node, interface number) -> link already sending from it
+    for i, l in enumerate(spec_D.get('links', [])):
+        if not isinstance(l, dict):
+            error_L.append('link %d %r is not an object' % (i, l))
+            continue
+        desc = 'link %d (%s-%s to %s-%s)' % (i, l.get('from'), l.get('from_intf', 0), l.get('to'), l.get('to_intf', 0))
+        for end in ('from', 'to'):
+            node = l.get(end)
+            intf = l.get(end + '_intf', 0)
+            if node not in intf_count_D:
+                error_L.append('%s: unknown node %r' % (desc, node))
+            elif not is_natural(intf) or intf >= intf_count_D[node]:
+                error_L.append('%s: node %s has no interface %r' % (desc, node, intf))
+        mtu = l.get('mtu')
+        if not isinstance(mtu, int) or mtu <= header_length:
+            error_L.append('%s: MTU %r leaves no room for payload after a %d byte header' % (desc, mtu, header_length))
+        error_L.extend(check_link_settings(desc, l, on_link=True))
+        key = (l.get('from'), l.get('from_intf', 0))
+        if key in out_intf_D:
+            error_L.append('%s: interface already sending on link %d' % (desc, out_intf_D[key]))
+        else:
+            out_intf_D[key] = i
+    return error_L
+
+
+# build a description
+# @param spec_D: description, as read from JSON
+# @param intf_class: interface class of the hosts and routers, e.g. network.AsyncInterface
+# @param max_queue_size: router queue size overriding those of the description, None to keep them
+# @param scheduler: router scheduler (see qdisc.make) overriding those of the description, None to keep them
+# @param drop_policy: router drop policy (see aqm.make) overriding those of the description, None to keep them
+# @param link_layer_D: link layer settings overriding those of the description
+# @return Topology
+def build(spec_D, intf_class=network.Interface, max_queue_size=None, scheduler=None, drop_policy=None,
+          **link_layer_D):
+    error_L = validate(spec_D) + check_link_settings('link layer override', link_layer_D)
+    if error_L:
+        raise ValueError('invalid topology:\n' + '\n'.join(error_L))
+    topo = Topology()
+    for h in spec_D.get('hosts', []):
+        topo.host_D[h['addr']] = network.Host(h['addr'], intf_class=intf_class)
+    for r in spec_D.get('routers', []):
+        table = RoutingTable({int(addr): intf for addr, intf in r.get('routes', {}).items()}, r.get('default'))
+        for prefix, length, intf in r.get('prefixes', []):
+            table.add_prefix(prefix, length, intf)
+        for lo, hi, intf in r.get('ranges', []):
+            table.add_range(lo, hi, intf)
+        queue_size = r.get('max_queue_size', 0) if max_queue_size is None else max_queue_size
+        router_scheduler = scheduler
+        if router_scheduler is None and r.get('scheduler', 'fifo') != 'fifo':
+            param_D = r['scheduler'] if isinstance(r['scheduler'], dict) else {'name': r['scheduler']}
+            param_D = dict(param_D)
+            router_scheduler = qdisc.make(param_D.pop('name'), **param_D)
+        router_policy = drop_policy
+        if router_policy is None and r.get('drop_policy', 'none') != 'none':
+            param_D = r['drop_policy'] if isinstance(r['drop_policy'], dict) else {'name': r['drop_policy']}
+            param_D = dict(param_D)
+            router_policy = aqm.make(param_D.pop('name'), **param_D)
+        topo.router_D[r['name']] = network.Router(r['name'], r.get('intf_count', 1), queue_size, table,
+                                                  intf_class=intf_class, scheduler=router_scheduler,
+                                                  drop_policy=router_policy, intf_budget=r.get('intf_budget', 8))
+    layer_D = dict(spec_D.get('link_layer', {}))
+    layer_D.update(link_layer_D)
+    topo.link_layer = link.LinkLayer(**layer_D)
+    node_D = dict(topo.host_D)
+    node_D.update(topo.router_D)
+    for l in spec_D.get('links', []):
+        topo.link_layer.add_link(link.Link(node_D[l['from']], l.get('from_intf', 0), node_D[l['to']], l.get('to_intf', 0),
+                                           l['mtu'], l.get('batch_pkts'), l.get('batch_bytes'), l.get('bandwidth'),
+                                           l.get('delay')))
+    if spec_D.get('routing') == 'shortest_path':
+        topo.routing = routing.install_shortest_paths(topo.link_layer.link_L)
+    for router in topo.router_D.values():
+        router.routing_table.compile()
+    return topo
+
+# EOF